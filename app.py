@@ -1,9 +1,396 @@
 # Import necessary libraries
 import streamlit as st
-import preprocessor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextlib
+import contextvars
+import threading
+import chat_cache
 import helper
-import seaborn as sns
-import matplotlib.pyplot as plt
+import charts
+import instrumentation
+import os
+
+# Upper bounds of the in-process caches: parsed chats kept in memory and
+# helper results kept across reruns (least recently used entries go first)
+MAX_CACHED_CHATS = int(os.environ.get('WA_APP_CACHED_CHATS', 4))
+MAX_CACHED_RESULTS = int(os.environ.get('WA_APP_CACHED_RESULTS', 512))
+MAX_CACHED_CHARTS = int(os.environ.get('WA_APP_CACHED_CHARTS', 256))
+CACHE_TTL = os.environ.get('WA_APP_CACHE_TTL', '6h')
+
+# Complete Analysis computes every section at once on a thread pool and shows
+# each one as soon as it is ready; set to 0 to compute them one after another
+PROGRESSIVE = os.environ.get('WA_APP_PROGRESSIVE', '1') != '0'
+SECTION_WORKERS = int(os.environ.get('WA_APP_SECTION_WORKERS', 8))
+
+
+@st.cache_resource(max_entries=MAX_CACHED_CHATS, ttl=CACHE_TTL, show_spinner="Parsing chat...")
+def load_chat(file_hash, _bytes_data):
+    # One shared DataFrame per export, so the sentiment, feature and activity
+    # structures the helpers keep with it survive reruns
+    return chat_cache.load_chat(_bytes_data)
+
+
+@st.cache_data(max_entries=MAX_CACHED_RESULTS, ttl=CACHE_TTL, show_spinner=False)
+def analyze(func_name, file_hash, selected_user, _df, **kwargs):
+    # Helper results keyed by file hash, user, helper and its arguments; the
+    # frame itself is not hashed
+    func = getattr(helper, func_name)
+    if selected_user is None:
+        return func(_df, **kwargs)
+    return func(selected_user, _df, **kwargs)
+
+
+@st.cache_data(max_entries=MAX_CACHED_CHARTS, ttl=CACHE_TTL, show_spinner=False)
+def chart(chart_name, file_hash, selected_user, _data):
+    # Rendered PNG bytes keyed by file hash, user and chart. Charts are drawn
+    # in the worker pool, so sections rendering at once draw in parallel
+    return charts.render(chart_name, _data)
+
+
+def file_hash_of(uploaded_file):
+    # Hash each upload once per session instead of on every rerun
+    hashes = st.session_state.setdefault('file_hashes', {})
+    file_id = getattr(uploaded_file, 'file_id', None) or uploaded_file.name
+    if file_id not in hashes:
+        hashes[file_id] = chat_cache.chat_key(uploaded_file.getvalue())
+    return hashes[file_id]
+
+
+# Every section is split into a compute function, which only calls helpers
+# and renders charts and so can run on a worker thread, and a show function
+# that writes the result to the page from the script thread
+
+def compute_stats(file_hash, selected_user, df):
+    return analyze('fetch_stats', file_hash, selected_user, df)
+
+
+def show_stats(stats):
+    num_messages, words, no_media_msg, no_links = stats
+    st.title("📊 Basic Statistics")
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric("Total Messages", num_messages)
+
+    with col2:
+        st.metric("Total Words", words)
+
+    with col3:
+        st.metric("Media Shared", no_media_msg)
+
+    with col4:
+        st.metric("Links Shared", no_links)
+
+
+def compute_sentiment(file_hash, selected_user, df):
+    sentiment_summary = analyze('sentiment_analysis', file_hash, selected_user, df)
+    sentiment_timeline = analyze('sentiment_timeline', file_hash, selected_user, df)
+    return {
+        'summary': sentiment_summary,
+        'pie': chart('sentiment_pie', file_hash, selected_user, sentiment_summary),
+        'scores': chart('sentiment_scores', file_hash, selected_user, sentiment_summary),
+        'timeline': None if sentiment_timeline.empty else
+        chart('sentiment_timeline', file_hash, selected_user, sentiment_timeline),
+        'positive': analyze('get_extreme_sentiment_messages', file_hash, selected_user, df,
+                            sentiment_type='positive', top_n=5),
+        'negative': analyze('get_extreme_sentiment_messages', file_hash, selected_user, df,
+                            sentiment_type='negative', top_n=5)
+    }
+
+
+def show_sentiment(result):
+    st.title("😊 Sentiment Analysis")
+    sentiment_summary = result['summary']
+
+    # Display sentiment percentages with proper spacing
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.metric("Positive Messages", f"{sentiment_summary['positive']:.1f}%")
+
+    with col2:
+        st.metric("Negative Messages", f"{sentiment_summary['negative']:.1f}%")
+
+    with col3:
+        st.metric("Neutral Messages", f"{sentiment_summary['neutral']:.1f}%")
+
+    with col4:
+        avg_sentiment = sentiment_summary['avg_sentiment']
+        sentiment_label = "😊 Positive" if avg_sentiment > 0.1 else "😐 Neutral" if avg_sentiment > -0.1 else "😔 Negative"
+        st.metric("Average Sentiment", sentiment_label, f"{avg_sentiment:.3f}")
+
+    # Sentiment Distribution Chart
+    st.subheader("📊 Sentiment Distribution")
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Pie chart for sentiment distribution
+        st.image(result['pie'])
+
+    with col2:
+        # Bar chart for sentiment scores
+        st.image(result['scores'])
+
+    # Sentiment Timeline
+    st.subheader("📈 Sentiment Timeline")
+    if result['timeline'] is not None:
+        st.image(result['timeline'])
+
+    # Top Positive and Negative Messages
+    st.subheader("🎭 Most Positive and Negative Messages")
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.markdown("#### 🟢 Most Positive Messages")
+        for i, (msg, score) in enumerate(result['positive'], 1):
+            with st.expander(f"Message {i} (Score: {score:.3f})"):
+                st.write(msg)
+
+    with col2:
+        st.markdown("#### 🔴 Most Negative Messages")
+        for i, (msg, score) in enumerate(result['negative'], 1):
+            with st.expander(f"Message {i} (Score: {score:.3f})"):
+                st.write(msg)
+
+
+def compute_timeline(file_hash, selected_user, df):
+    timeline = analyze('monthly_timeline', file_hash, selected_user, df)
+    daily_timeline = analyze('daily_timeline', file_hash, selected_user, df)
+    busy_day = analyze('week_activity_map', file_hash, selected_user, df)
+    busy_month = analyze('month_activity_map', file_hash, selected_user, df)
+    return {
+        'monthly': chart('monthly_timeline', file_hash, selected_user, timeline),
+        'daily': chart('daily_timeline', file_hash, selected_user, daily_timeline),
+        'week': chart('week_activity', file_hash, selected_user, busy_day),
+        'month': chart('month_activity', file_hash, selected_user, busy_month)
+    }
+
+
+def show_timeline(result):
+    st.title("📈 Activity Timeline")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # Monthly timeline plot
+        st.subheader("📅 Monthly Timeline")
+        st.image(result['monthly'])
+
+    with col2:
+        # Daily timeline plot
+        st.subheader("📆 Daily Timeline")
+        st.image(result['daily'])
+
+    # Daily and Monthly activity maps
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("📊 Weekly Activity")
+        st.image(result['week'])
+
+    with col2:
+        st.subheader("📊 Monthly Activity")
+        st.image(result['month'])
+
+
+def compute_busy_users(file_hash, selected_user, df):
+    x, new_df = analyze('most_busy_users', file_hash, None, df)
+    return {'chart': chart('busy_users', file_hash, None, x), 'table': new_df}
+
+
+def show_busy_users(result):
+    st.title("👥 Most Busy Users")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.subheader("📊 User Activity Chart")
+        st.image(result['chart'])
+
+    with col2:
+        st.subheader("📈 User Statistics Table")
+        st.dataframe(result['table'], use_container_width=True)
+
+
+def compute_leaderboard(file_hash, selected_user, df):
+    # Needs the sentiment pass, so it is kept apart from the busy users chart
+    return analyze('user_leaderboard', file_hash, None, df)
+
+
+def show_leaderboard(leaderboard):
+    # Every sender in one table; click a column header to sort by it
+    st.subheader("🏆 User Leaderboard")
+    st.dataframe(leaderboard, use_container_width=True, column_config={
+        'percent': st.column_config.NumberColumn("percent", format="%.2f%%"),
+        'avg_sentiment': st.column_config.NumberColumn("avg_sentiment", format="%.3f")
+    })
+
+
+def compute_wordcloud(file_hash, selected_user, df):
+    df_wc = analyze('create_wordcloud', file_hash, selected_user, df)
+    if df_wc is None:
+        return None
+    return chart('wordcloud', file_hash, selected_user, df_wc)
+
+
+def show_wordcloud(result):
+    st.title("☁️ Word Cloud")
+    if result is None:
+        st.info("No words to show in the word cloud.")
+    else:
+        st.image(result)
+
+
+def compute_common_words(file_hash, selected_user, df):
+    most_common_df = analyze('most_common_words', file_hash, selected_user, df)
+    if most_common_df.empty:
+        return {'table': most_common_df, 'chart': None}
+    return {'table': most_common_df, 'chart': chart('most_common_words', file_hash, selected_user, most_common_df)}
+
+
+def show_common_words(result):
+    st.title("📝 Most Common Words")
+    most_common_df = result['table']
+    if not most_common_df.empty:
+        col1, col2 = st.columns([2, 1])
+
+        with col1:
+            st.image(result['chart'])
+
+        with col2:
+            st.subheader("📊 Word Frequency Table")
+            st.dataframe(most_common_df.head(10), use_container_width=True)
+    else:
+        st.info("No common words found.")
+
+
+def compute_emojis(file_hash, selected_user, df):
+    emoji_df = analyze('emoji_helper', file_hash, selected_user, df)
+    if emoji_df.empty:
+        return {'table': emoji_df, 'chart': None}
+    return {'table': emoji_df, 'chart': chart('top_emojis', file_hash, selected_user, emoji_df.head(10))}
+
+
+def show_emojis(result):
+    st.title("😀 Emoji Analysis")
+    emoji_df = result['table']
+    if not emoji_df.empty:
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.subheader("📊 Top Emojis Chart")
+            st.image(result['chart'])
+
+        with col2:
+            st.subheader("😊 Emoji Usage Statistics")
+            st.dataframe(emoji_df.head(15), use_container_width=True)
+    else:
+        st.info("😔 No emojis found in the selected messages.")
+
+
+def compute_heatmap(file_hash, selected_user, df):
+    user_heatmap = analyze('activity_heatmap', file_hash, selected_user, df)
+    return chart('activity_heatmap', file_hash, selected_user, user_heatmap)
+
+
+def show_heatmap(result):
+    st.title("🔥 Activity Heatmap")
+    st.image(result)
+
+
+# Sections in page order, with their compute and show functions
+SECTIONS = {
+    "📊 Basic Statistics": (compute_stats, show_stats),
+    "😊 Sentiment Analysis": (compute_sentiment, show_sentiment),
+    "📈 Activity Timeline": (compute_timeline, show_timeline),
+    "👥 Most Busy Users": (compute_busy_users, show_busy_users),
+    "🏆 User Leaderboard": (compute_leaderboard, show_leaderboard),
+    "☁️ Word Cloud": (compute_wordcloud, show_wordcloud),
+    "📝 Most Common Words": (compute_common_words, show_common_words),
+    "😀 Emoji Analysis": (compute_emojis, show_emojis),
+    "🔥 Activity Heatmap": (compute_heatmap, show_heatmap)
+}
+
+# Sections only shown for Overall
+OVERALL_ONLY = ["👥 Most Busy Users", "🏆 User Leaderboard"]
+
+# Sections that follow a selected analysis in their own placeholder instead
+# of being chosen on their own: the leaderboard waits for the sentiment pass,
+# so the busy users chart and table are shown without it
+FOLLOWERS = {"👥 Most Busy Users": ["🏆 User Leaderboard"]}
+
+# Order in which Complete Analysis submits sections to the pool: sections
+# that only count messages first, so they claim workers before the emoji,
+# word and sentiment passes, and the leaderboard, which waits for the
+# sentiment pass, last
+SUBMIT_ORDER = ["📊 Basic Statistics", "📈 Activity Timeline", "👥 Most Busy Users", "🔥 Activity Heatmap",
+                "😀 Emoji Analysis", "📝 Most Common Words", "☁️ Word Cloud", "😊 Sentiment Analysis",
+                "🏆 User Leaderboard"]
+
+
+def attach_script_run_ctx(ctx):
+    # Pool initializer: let worker threads use the app's caches without warnings
+    add_script_run_ctx(threading.current_thread(), ctx)
+
+
+def run_progressive(sections, file_hash, selected_user, df):
+    """
+    Compute the given sections concurrently and show each one in its own
+    placeholder as soon as its result arrives. Returns the results by section.
+    """
+    placeholders = {}
+    for name in sections:
+        placeholders[name] = st.empty()
+        placeholders[name].info(f"⏳ {name}...")
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=SECTION_WORKERS, initializer=attach_script_run_ctx,
+                            initargs=(get_script_run_ctx(),)) as pool:
+        # Each section runs in a copy of the current context, so stage timings
+        # recorded on the worker threads land in this run's records
+        futures = {pool.submit(contextvars.copy_context().run, SECTIONS[name][0], file_hash, selected_user, df): name
+                   for name in SUBMIT_ORDER if name in sections}
+
+        for future in as_completed(futures):
+            name = futures[future]
+            results[name] = future.result()
+            with placeholders[name].container():
+                SECTIONS[name][1](results[name])
+
+    return results
+
+
+def run_analysis(selected_analysis, file_hash, selected_user, df):
+    """
+    Compute and show the selected analysis, returning the number of messages
+    analyzed for the information panel
+    """
+    if selected_analysis == "🎯 Complete Analysis":
+        # Most Busy Users and the leaderboard are only shown for Overall
+        sections = [name for name in SECTIONS if name not in OVERALL_ONLY or selected_user == 'Overall']
+
+        if PROGRESSIVE:
+            results = run_progressive(sections, file_hash, selected_user, df)
+        else:
+            results = {}
+            for name in sections:
+                results[name] = SECTIONS[name][0](file_hash, selected_user, df)
+                SECTIONS[name][1](results[name])
+
+        return results["📊 Basic Statistics"][0]
+
+    if selected_analysis == "👥 Most Busy Users" and selected_user != 'Overall':
+        st.warning("⚠️ 'Most Busy Users' analysis is only available for 'Overall' selection.")
+        return compute_stats(file_hash, selected_user, df)[0]
+
+    compute, show = SECTIONS[selected_analysis]
+    show(compute(file_hash, selected_user, df))
+    if selected_analysis in FOLLOWERS:
+        run_progressive(FOLLOWERS[selected_analysis], file_hash, selected_user, df)
+    st.markdown("---")
+    return compute_stats(file_hash, selected_user, df)[0]
+
 
 # Set up the sidebar title for the app
 st.sidebar.title("WhatsApp Chat Analyzer")
@@ -13,12 +400,14 @@ uploaded_file = st.sidebar.file_uploader("Choose a file")
 if uploaded_file is not None:
     # Read the uploaded file
     bytes_data = uploaded_file.getvalue()
-    data = bytes_data.decode("utf-8")
+    file_hash = file_hash_of(uploaded_file)
 
-    # Preprocess the data to create a DataFrame
-    df = preprocessor.preprocess(data)
+    # Preprocess the data to create a DataFrame, reusing a cached parse of
+    # the same export when there is one
+    df = load_chat(file_hash, bytes_data)
 
-    # Display the DataFrame in the main area of the app
+    # Display the parsed chat in the main area of the app. The frame is shared
+    # by every session and helpers never modify it, so it is shown as is.
     st.dataframe(df)
 
     # Fetch the unique list of users from the chat
@@ -47,303 +436,14 @@ if uploaded_file is not None:
 
     selected_analysis = st.sidebar.selectbox("Select Analysis Type:", analysis_options)
 
+    # Record per-stage timings of the next analysis (WA_PROFILE=1 turns this on by default)
+    record_timings = st.sidebar.checkbox("⏱️ Record stage timings", value=instrumentation.ENABLED)
+
     # Button to trigger the analysis
     if st.sidebar.button("Show Analysis"):
 
-        # Always fetch basic statistics
-        num_messages, words, no_media_msg, no_links = helper.fetch_stats(selected_user, df)
-
-        # Basic Statistics
-        if selected_analysis == "📊 Basic Statistics" or selected_analysis == "🎯 Complete Analysis":
-            st.title("📊 Basic Statistics")
-            col1, col2, col3, col4 = st.columns(4)
-
-            with col1:
-                st.metric("Total Messages", num_messages)
-
-            with col2:
-                st.metric("Total Words", words)
-
-            with col3:
-                st.metric("Media Shared", no_media_msg)
-
-            with col4:
-                st.metric("Links Shared", no_links)
-
-            if selected_analysis != "🎯 Complete Analysis":
-                st.markdown("---")
-
-        # Sentiment Analysis
-        if selected_analysis == "😊 Sentiment Analysis" or selected_analysis == "🎯 Complete Analysis":
-            st.title("😊 Sentiment Analysis")
-            sentiment_summary = helper.sentiment_analysis(selected_user, df)
-
-            # Display sentiment percentages with proper spacing
-            col1, col2, col3, col4 = st.columns(4)
-
-            with col1:
-                st.metric("Positive Messages", f"{sentiment_summary['positive']:.1f}%")
-
-            with col2:
-                st.metric("Negative Messages", f"{sentiment_summary['negative']:.1f}%")
-
-            with col3:
-                st.metric("Neutral Messages", f"{sentiment_summary['neutral']:.1f}%")
-
-            with col4:
-                avg_sentiment = sentiment_summary['avg_sentiment']
-                sentiment_label = "😊 Positive" if avg_sentiment > 0.1 else "😐 Neutral" if avg_sentiment > -0.1 else "😔 Negative"
-                st.metric("Average Sentiment", sentiment_label, f"{avg_sentiment:.3f}")
-
-            # Sentiment Distribution Chart
-            st.subheader("📊 Sentiment Distribution")
-            col1, col2 = st.columns(2)
-
-            with col1:
-                # Pie chart for sentiment distribution
-                fig, ax = plt.subplots(figsize=(8, 6))
-                sentiment_counts = [sentiment_summary['positive'], sentiment_summary['negative'],
-                                    sentiment_summary['neutral']]
-                colors = ['#2E8B57', '#DC143C', '#808080']
-                labels = ['Positive', 'Negative', 'Neutral']
-                wedges, texts, autotexts = ax.pie(sentiment_counts, labels=labels, colors=colors,
-                                                  autopct='%1.1f%%', startangle=90)
-                ax.set_title('Sentiment Distribution')
-                st.pyplot(fig)
-
-            with col2:
-                # Bar chart for sentiment scores
-                fig, ax = plt.subplots(figsize=(8, 6))
-                categories = ['Positive', 'Negative', 'Neutral', 'Compound']
-                scores = [sentiment_summary['avg_positive'], sentiment_summary['avg_negative'],
-                          sentiment_summary['avg_neutral'], sentiment_summary['avg_sentiment']]
-                colors = ['#2E8B57', '#DC143C', '#808080', '#4169E1']
-                bars = ax.bar(categories, scores, color=colors)
-                ax.set_title('Average Sentiment Scores')
-                ax.set_ylabel('Score')
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                st.pyplot(fig)
-
-            # Sentiment Timeline
-            st.subheader("📈 Sentiment Timeline")
-            sentiment_timeline = helper.sentiment_timeline(selected_user, df)
-            if not sentiment_timeline.empty:
-                fig, ax = plt.subplots(figsize=(12, 6))
-                ax.plot(sentiment_timeline['date'], sentiment_timeline['sentiment_score'],
-                        color='blue', alpha=0.7, linewidth=2)
-                ax.axhline(y=0, color='black', linestyle='--', alpha=0.5)
-                ax.fill_between(sentiment_timeline['date'], sentiment_timeline['sentiment_score'],
-                                where=(sentiment_timeline['sentiment_score'] > 0), color='green', alpha=0.3,
-                                label='Positive')
-                ax.fill_between(sentiment_timeline['date'], sentiment_timeline['sentiment_score'],
-                                where=(sentiment_timeline['sentiment_score'] < 0), color='red', alpha=0.3,
-                                label='Negative')
-                ax.set_title('Sentiment Over Time')
-                ax.set_xlabel('Date')
-                ax.set_ylabel('Sentiment Score')
-                ax.legend()
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                st.pyplot(fig)
-
-            # Top Positive and Negative Messages
-            st.subheader("🎭 Most Positive and Negative Messages")
-            col1, col2 = st.columns(2)
-
-            with col1:
-                st.markdown("#### 🟢 Most Positive Messages")
-                positive_messages = helper.get_extreme_sentiment_messages(selected_user, df, sentiment_type='positive',
-                                                                          top_n=5)
-                for i, (msg, score) in enumerate(positive_messages, 1):
-                    with st.expander(f"Message {i} (Score: {score:.3f})"):
-                        st.write(msg)
-
-            with col2:
-                st.markdown("#### 🔴 Most Negative Messages")
-                negative_messages = helper.get_extreme_sentiment_messages(selected_user, df, sentiment_type='negative',
-                                                                          top_n=5)
-                for i, (msg, score) in enumerate(negative_messages, 1):
-                    with st.expander(f"Message {i} (Score: {score:.3f})"):
-                        st.write(msg)
-
-            if selected_analysis != "🎯 Complete Analysis":
-                st.markdown("---")
-
-        # Activity Timeline
-        if selected_analysis == "📈 Activity Timeline" or selected_analysis == "🎯 Complete Analysis":
-            st.title("📈 Activity Timeline")
-
-            col1, col2 = st.columns(2)
-
-            with col1:
-                # Monthly timeline plot
-                st.subheader("📅 Monthly Timeline")
-                timeline = helper.monthly_timeline(selected_user, df)
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.plot(timeline['time'], timeline['message'], color='orange', marker='o', linewidth=2)
-                ax.set_title('Monthly Message Activity')
-                ax.set_xlabel('Month-Year')
-                ax.set_ylabel('Number of Messages')
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                st.pyplot(fig)
-
-            with col2:
-                # Daily timeline plot
-                st.subheader("📆 Daily Timeline")
-                daily_timeline = helper.daily_timeline(selected_user, df)
-                fig, ax = plt.subplots(figsize=(10, 6))
-                ax.plot(daily_timeline['only_date'], daily_timeline['message'], color='pink', alpha=0.7)
-                ax.set_title('Daily Message Activity')
-                ax.set_xlabel('Date')
-                ax.set_ylabel('Number of Messages')
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                st.pyplot(fig)
-
-            # Daily and Monthly activity maps
-            col1, col2 = st.columns(2)
-
-            with col1:
-                st.subheader("📊 Weekly Activity")
-                busy_day = helper.week_activity_map(selected_user, df)
-                fig, ax = plt.subplots(figsize=(8, 6))
-                bars = ax.bar(busy_day.index, busy_day.values, color='lightblue', edgecolor='navy')
-                ax.set_title('Messages by Day of Week')
-                ax.set_xlabel('Day of Week')
-                ax.set_ylabel('Number of Messages')
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                st.pyplot(fig)
-
-            with col2:
-                st.subheader("📊 Monthly Activity")
-                busy_month = helper.month_activity_map(selected_user, df)
-                fig, ax = plt.subplots(figsize=(8, 6))
-                bars = ax.bar(busy_month.index, busy_month.values, color='lightcoral', edgecolor='darkred')
-                ax.set_title('Messages by Month')
-                ax.set_xlabel('Month')
-                ax.set_ylabel('Number of Messages')
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                st.pyplot(fig)
-
-            if selected_analysis != "🎯 Complete Analysis":
-                st.markdown("---")
-
-        # Most Busy Users (only for Overall)
-        if (
-                selected_analysis == "👥 Most Busy Users" or selected_analysis == "🎯 Complete Analysis") and selected_user == 'Overall':
-            st.title("👥 Most Busy Users")
-            x, new_df = helper.most_busy_users(df)
-
-            col1, col2 = st.columns(2)
-
-            with col1:
-                st.subheader("📊 User Activity Chart")
-                fig, ax = plt.subplots(figsize=(10, 6))
-                bars = ax.bar(x.index, x.values, color='green', edgecolor='darkgreen')
-                ax.set_title('Messages by User')
-                ax.set_xlabel('Users')
-                ax.set_ylabel('Number of Messages')
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                st.pyplot(fig)
-
-            with col2:
-                st.subheader("📈 User Statistics Table")
-                st.dataframe(new_df, use_container_width=True)
-
-            if selected_analysis != "🎯 Complete Analysis":
-                st.markdown("---")
-
-        elif selected_analysis == "👥 Most Busy Users" and selected_user != 'Overall':
-            st.warning("⚠️ 'Most Busy Users' analysis is only available for 'Overall' selection.")
-
-        # Word Cloud
-        if selected_analysis == "☁️ Word Cloud" or selected_analysis == "🎯 Complete Analysis":
-            st.title("☁️ Word Cloud")
-            df_wc = helper.create_wordcloud(selected_user, df)
-            fig, ax = plt.subplots(figsize=(12, 8))
-            ax.imshow(df_wc, interpolation='bilinear')
-            ax.axis('off')
-            ax.set_title('Most Common Words Cloud', fontsize=16, pad=20)
-            plt.tight_layout()
-            st.pyplot(fig)
-
-            if selected_analysis != "🎯 Complete Analysis":
-                st.markdown("---")
-
-        # Most Common Words
-        if selected_analysis == "📝 Most Common Words" or selected_analysis == "🎯 Complete Analysis":
-            st.title("📝 Most Common Words")
-            most_common_df = helper.most_common_words(selected_user, df)
-            if not most_common_df.empty:
-                col1, col2 = st.columns([2, 1])
-
-                with col1:
-                    fig, ax = plt.subplots(figsize=(12, 8))
-                    bars = ax.barh(most_common_df[0], most_common_df[1], color='skyblue', edgecolor='navy')
-                    ax.set_title('Top 20 Most Common Words')
-                    ax.set_xlabel('Frequency')
-                    ax.set_ylabel('Words')
-                    plt.tight_layout()
-                    st.pyplot(fig)
-
-                with col2:
-                    st.subheader("📊 Word Frequency Table")
-                    st.dataframe(most_common_df.head(10), use_container_width=True)
-            else:
-                st.info("No common words found.")
-
-            if selected_analysis != "🎯 Complete Analysis":
-                st.markdown("---")
-
-        # Emoji Analysis
-        if selected_analysis == "😀 Emoji Analysis" or selected_analysis == "🎯 Complete Analysis":
-            st.title("😀 Emoji Analysis")
-            emoji_df = helper.emoji_helper(selected_user, df)
-            if not emoji_df.empty:
-                col1, col2 = st.columns(2)
-
-                with col1:
-                    st.subheader("📊 Top Emojis Chart")
-                    if len(emoji_df) > 0:
-                        top_emojis = emoji_df.head(10)
-                        fig, ax = plt.subplots(figsize=(8, 6))
-                        bars = ax.bar(range(len(top_emojis)), top_emojis[1], color='gold', edgecolor='orange')
-                        ax.set_title('Top 10 Most Used Emojis')
-                        ax.set_xlabel('Emoji Rank')
-                        ax.set_ylabel('Usage Count')
-                        ax.set_xticks(range(len(top_emojis)))
-                        ax.set_xticklabels(top_emojis[0], fontsize=16)
-                        plt.tight_layout()
-                        st.pyplot(fig)
-
-                with col2:
-                    st.subheader("😊 Emoji Usage Statistics")
-                    st.dataframe(emoji_df.head(15), use_container_width=True)
-            else:
-                st.info("😔 No emojis found in the selected messages.")
-
-            if selected_analysis != "🎯 Complete Analysis":
-                st.markdown("---")
-
-        # Activity Heatmap
-        if selected_analysis == "🔥 Activity Heatmap" or selected_analysis == "🎯 Complete Analysis":
-            st.title("🔥 Activity Heatmap")
-            user_heatmap = helper.activity_heatmap(selected_user, df)
-            fig, ax = plt.subplots(figsize=(14, 8))
-            sns.heatmap(user_heatmap, annot=True, cmap='YlOrRd', ax=ax, fmt='g')
-            ax.set_title('Activity Heatmap: Messages by Day and Hour')
-            ax.set_xlabel('Time Period')
-            ax.set_ylabel('Day of Week')
-            plt.tight_layout()
-            st.pyplot(fig)
-
-            if selected_analysis != "🎯 Complete Analysis":
-                st.markdown("---")
+        with instrumentation.recording() if record_timings else contextlib.nullcontext([]) as records:
+            num_messages = run_analysis(selected_analysis, file_hash, selected_user, df)
 
         # Success message
         st.success(f"✅ Analysis completed for {selected_user}!")
@@ -355,3 +455,13 @@ if uploaded_file is not None:
             st.write(f"**Total Messages Analyzed:** {num_messages}")
             st.write(
                 f"**Date Range:** {df['date'].min().strftime('%Y-%m-%d')} to {df['date'].max().strftime('%Y-%m-%d')}")
+
+            if record_timings:
+                # Stages served from the result and chart caches do not run, so they are not listed
+                st.write("**Stage Timings:**")
+                if records:
+                    st.dataframe(instrumentation.summarize(records), use_container_width=True)
+                    st.caption("Every call, in the order it finished")
+                    st.dataframe(records, use_container_width=True)
+                else:
+                    st.write("Every result was served from the cache.")
@@ -0,0 +1,230 @@
+# Headless batch analysis of many chat exports, without Streamlit or plotting
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import helper
+import incremental
+import parallel
+import preprocessor
+
+try:
+    import pyarrow  # noqa: F401  (needed by DataFrame.to_parquet)
+except ImportError:  # only JSON reports are available without pyarrow
+    pyarrow = None
+
+# Report sections written as one Parquet table each, with a `chat` column
+TABLES = ['stats', 'monthly_timeline', 'daily_timeline', 'top_words', 'emojis', 'sentiment', 'sentiment_by_user']
+
+
+def build_report(views, source, users):
+    """
+    Report sections of one chat: statistics, timelines, top words, emojis
+    and sentiment, overall and per user. `views` is helper (with a parsed
+    frame as source) or incremental (with stored aggregates); both offer
+    the same functions. Every value is a plain Python type, so the report
+    can be dumped to JSON as is.
+    """
+    stats = []
+    for user in ['Overall'] + users:
+        num_messages, words, no_media_msg, no_links = views.fetch_stats(user, source)
+        stats.append({'user': user, 'messages': int(num_messages), 'words': int(words),
+                      'media': int(no_media_msg), 'links': int(no_links)})
+
+    timeline = views.monthly_timeline('Overall', source)
+    daily_timeline = views.daily_timeline('Overall', source)
+    top_words = views.most_common_words('Overall', source)
+    emojis = views.emoji_helper('Overall', source)
+    by_user = views.sentiment_by_user(source)
+
+    return {
+        'stats': stats,
+        'monthly_timeline': [{'month': month, 'messages': int(count)}
+                             for month, count in zip(timeline['time'], timeline['message'])],
+        'daily_timeline': [{'date': date.strftime('%Y-%m-%d'), 'messages': int(count)}
+                           for date, count in zip(daily_timeline['only_date'], daily_timeline['message'])],
+        'top_words': [{'word': word, 'count': int(count)} for word, count in top_words.itertuples(index=False)],
+        'emojis': [{'emoji': e, 'count': int(count)} for e, count in emojis.itertuples(index=False)],
+        'sentiment': [{'user': 'Overall', **{key: float(value) for key, value in
+                                             views.sentiment_analysis('Overall', source).items()}}],
+        'sentiment_by_user': [{'user': user, **{key: float(value) for key, value in row.items()}}
+                              for user, row in by_user.iterrows()]
+    }
+
+
+def analyze_chat(data):
+    # Report of one export, parsed in full
+    df = preprocessor.preprocess(data)
+    users = sorted(user for user in df['user'].unique() if user != 'group_notification')
+
+    return {
+        'messages': len(df),
+        'users': users,
+        'first_message': df['date'].min().isoformat() if len(df) else None,
+        'last_message': df['date'].max().isoformat() if len(df) else None,
+        **build_report(helper, df, users)
+    }
+
+
+def analyze_incremental(bytes_data, store_dir):
+    # Report of one export, parsing only what was added since its last run
+    aggregates, info = incremental.ingest(bytes_data, store_dir)
+    users = sorted(user for user in aggregates['messages'] if user != 'group_notification')
+
+    return {
+        'messages': int(sum(aggregates['messages'].values())),
+        'users': users,
+        'first_message': aggregates['first_date'].isoformat() if aggregates['first_date'] is not None else None,
+        'last_message': aggregates['last_date'].isoformat() if aggregates['last_date'] is not None else None,
+        'ingest': info,
+        **build_report(incremental, aggregates, users)
+    }
+
+
+def process_file(path, incremental_dir=None):
+    """
+    Read, parse and analyze one export, returning its report with per-stage
+    timings. With incremental_dir, aggregates stored there by earlier runs
+    are extended instead. Failures are reported instead of raised, so one
+    bad file does not stop the batch.
+    """
+    start = time.perf_counter()
+    report = {'chat': os.path.splitext(os.path.basename(path))[0], 'path': path}
+
+    try:
+        with open(path, 'rb') as f:
+            bytes_data = f.read()
+        read_done = time.perf_counter()
+
+        if incremental_dir:
+            report.update(analyze_incremental(bytes_data, incremental_dir))
+        else:
+            report.update(analyze_chat(bytes_data.decode('utf-8')))
+        report['bytes'] = len(bytes_data)
+        report['timings'] = {'read': read_done - start, 'analysis': time.perf_counter() - read_done}
+        report['error'] = None
+    except Exception as e:
+        report['error'] = f"{type(e).__name__}: {e}"
+
+    report.setdefault('timings', {})['total'] = time.perf_counter() - start
+
+    return report
+
+
+def init_worker(sentiment_engine):
+    # Each worker handles whole files, so helpers must not start pools of their own
+    parallel.WORKERS = 1
+    if sentiment_engine:
+        helper.SENTIMENT_ENGINE = sentiment_engine
+
+
+def run_batch(paths, workers=None, sentiment_engine=None, incremental_dir=None):
+    """
+    Process export files on a pool of worker processes and yield each
+    report as soon as it is ready
+    """
+    workers = workers or parallel.WORKERS
+    if workers <= 1:
+        init_worker(sentiment_engine)
+        for path in paths:
+            yield process_file(path, incremental_dir)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(sentiment_engine,)) as pool:
+        futures = [pool.submit(process_file, path, incremental_dir) for path in paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def write_json(report, out_dir):
+    with open(os.path.join(out_dir, f"{report['chat']}.json"), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def write_parquet(reports, out_dir):
+    # One table per report section, rows of every chat stacked with a `chat` column
+    for table in TABLES:
+        rows = [{'chat': report['chat'], **row} for report in reports if not report['error']
+                for row in report[table]]
+        pd.DataFrame(rows).to_parquet(os.path.join(out_dir, f"{table}.parquet"), index=False)
+
+
+def summarize(reports, wall_seconds):
+    """
+    Throughput of the whole run and timing of every file
+    """
+    done = [report for report in reports if not report['error']]
+    messages = sum(report['messages'] for report in done)
+    total_bytes = sum(report['bytes'] for report in done)
+
+    return {
+        'files': len(reports),
+        'failed': len(reports) - len(done),
+        'messages': messages,
+        'bytes': total_bytes,
+        'wall_seconds': wall_seconds,
+        'files_per_second': len(reports) / wall_seconds if wall_seconds else 0.0,
+        'messages_per_second': messages / wall_seconds if wall_seconds else 0.0,
+        'megabytes_per_second': total_bytes / 1024 ** 2 / wall_seconds if wall_seconds else 0.0,
+        'per_file': [{'chat': report['chat'], 'messages': report.get('messages'), 'error': report['error'],
+                      **report.get('ingest', {}), **report['timings']} for report in reports]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a directory of WhatsApp chat exports.")
+    parser.add_argument('input', help="directory of exported .txt chats, or a single export")
+    parser.add_argument('-o', '--output', default='reports', help="directory the reports are written to")
+    parser.add_argument('-f', '--format', choices=['json', 'parquet'], default='json',
+                        help="one JSON file per chat, or one Parquet table per report section")
+    parser.add_argument('-p', '--pattern', default='*.txt', help="file name pattern inside the input directory")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="worker processes (default: WA_WORKERS)")
+    parser.add_argument('--sentiment-engine', choices=['vader', 'batch'], default=None,
+                        help="sentiment engine (default: WA_SENTIMENT_ENGINE)")
+    parser.add_argument('--incremental', nargs='?', const=incremental.STORE_DIR, default=None, metavar='DIR',
+                        help="keep per-chat aggregates in DIR (default: WA_INCREMENTAL_DIR) and parse only "
+                             "the messages added since the previous export of each chat")
+    args = parser.parse_args(argv)
+
+    if args.format == 'parquet' and pyarrow is None:
+        parser.error("Parquet reports need pyarrow")
+
+    if os.path.isdir(args.input):
+        paths = sorted(glob.glob(os.path.join(args.input, args.pattern)))
+    else:
+        paths = [args.input]
+    os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    reports = []
+    for report in run_batch(paths, args.workers, args.sentiment_engine, args.incremental):
+        reports.append(report)
+        if args.format == 'json':
+            write_json(report, args.output)
+
+        status = report['error'] or f"{report['messages']} messages"
+        print(f"[{len(reports)}/{len(paths)}] {report['chat']}: {status} in {report['timings']['total']:.2f}s",
+              file=sys.stderr)
+
+    if args.format == 'parquet':
+        write_parquet(reports, args.output)
+
+    summary = summarize(reports, time.perf_counter() - start)
+    with open(os.path.join(args.output, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    print(f"{summary['files']} files ({summary['failed']} failed), {summary['messages']} messages "
+          f"in {summary['wall_seconds']:.2f}s: {summary['files_per_second']:.2f} files/s, "
+          f"{summary['messages_per_second']:.0f} messages/s, {summary['megabytes_per_second']:.2f} MB/s")
+
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+# Benchmark of parsing and every helper on synthetic exports of growing size
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import instrumentation
+
+# Chat sizes benchmarked by default, in messages
+DEFAULT_SIZES = [10000, 1000000, 10000000]
+
+# Where generated exports are kept between runs
+DATA_DIR = os.environ.get('WA_BENCH_DATA_DIR', os.path.join(tempfile.gettempdir(), 'whatsapp_bench'))
+
+# Stages faster than this in both runs are too noisy to call a regression
+NOISE_SECONDS = 0.05
+
+# How often peak memory is sampled while a stage runs, in seconds
+RSS_SAMPLE_INTERVAL = 0.005
+
+# Stages timed after parsing, in order. The first four build the per-chat
+# structures (feature and sentiment tables, activity cube, word counts)
+# that the helpers after them only read, so helper timings are warm.
+STAGES = [
+    ('message_features', lambda helper, df, user: helper.message_features(df)),
+    ('message_sentiment', lambda helper, df, user: helper.message_sentiment(df)),
+    ('activity_cube', lambda helper, df, user: helper.activity_cube(df)),
+    ('word_frequencies', lambda helper, df, user: helper.word_frequencies(user, df)),
+    ('fetch_stats', lambda helper, df, user: helper.fetch_stats(user, df)),
+    ('link_counts', lambda helper, df, user: helper.link_counts(df)),
+    ('most_busy_users', lambda helper, df, user: helper.most_busy_users(df)),
+    ('monthly_timeline', lambda helper, df, user: helper.monthly_timeline(user, df)),
+    ('daily_timeline', lambda helper, df, user: helper.daily_timeline(user, df)),
+    ('week_activity_map', lambda helper, df, user: helper.week_activity_map(user, df)),
+    ('month_activity_map', lambda helper, df, user: helper.month_activity_map(user, df)),
+    ('activity_heatmap', lambda helper, df, user: helper.activity_heatmap(user, df)),
+    ('most_common_words', lambda helper, df, user: helper.most_common_words(user, df)),
+    ('create_wordcloud', lambda helper, df, user: helper.create_wordcloud(user, df)),
+    ('emoji_helper', lambda helper, df, user: helper.emoji_helper(user, df)),
+    ('emoji_counts_by_user', lambda helper, df, user: helper.emoji_counts_by_user(df)),
+    ('sentiment_analysis', lambda helper, df, user: helper.sentiment_analysis(user, df)),
+    ('sentiment_timeline', lambda helper, df, user: helper.sentiment_timeline(user, df)),
+    ('get_extreme_sentiment_messages',
+     lambda helper, df, user: helper.get_extreme_sentiment_messages(user, df, 'positive')),
+    ('sentiment_by_user', lambda helper, df, user: helper.sentiment_by_user(df)),
+]
+
+
+def measure(func, *args):
+    """
+    Run func(*args) and return its result, the wall time and the highest
+    resident memory seen while it ran, sampled from a background thread
+    """
+    done = threading.Event()
+    peak = [instrumentation.rss_bytes()]
+
+    def sample():
+        while not done.wait(RSS_SAMPLE_INTERVAL):
+            peak[0] = max(peak[0], instrumentation.rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+    finally:
+        seconds = time.perf_counter() - start
+        done.set()
+        sampler.join()
+
+    return result, seconds, max(peak[0], instrumentation.rss_bytes())
+
+
+def export_path(messages, seed, data_dir=DATA_DIR):
+    """
+    Path of the synthetic export with this many messages, generated on first use
+    """
+    import synthetic_chat
+
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"chat-{messages}-seed{seed}.txt")
+    if not os.path.exists(path):
+        synthetic_chat.write_export(path + '.tmp', messages, seed=seed)
+        os.replace(path + '.tmp', path)
+
+    return path
+
+
+def run_size(messages, seed=0, user='Overall', data_dir=DATA_DIR):
+    """
+    Time reading, parsing and every stage on one synthetic export. Returns
+    wall seconds and peak RSS (MB) per stage.
+    """
+    import preprocessor
+    import helper
+
+    path = export_path(messages, seed, data_dir)
+    stages = {}
+
+    def record(name, func, *args):
+        result, seconds, peak = measure(func, *args)
+        stages[name] = {'seconds': round(seconds, 4), 'peak_rss_mb': round(peak / 1024 ** 2, 1)}
+        return result
+
+    def read():
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    text = record('read', read)
+    df = record('preprocess', preprocessor.preprocess, text)
+    del text
+
+    for name, stage in STAGES:
+        record(name, stage, helper, df, user)
+
+    return {
+        'messages': messages,
+        'rows': len(df),
+        'file_mb': round(os.path.getsize(path) / 1024 ** 2, 1),
+        'sentiment_engine': helper.SENTIMENT_ENGINE,
+        'workers': helper.parallel.WORKERS,
+        'stages': stages,
+        'total_seconds': round(sum(stage['seconds'] for stage in stages.values()), 4),
+        'peak_rss_mb': round(max(stage['peak_rss_mb'] for stage in stages.values()), 1)
+    }
+
+
+def run_isolated(messages, seed, user, data_dir):
+    # Each size runs in its own interpreter so peak memory is not inherited
+    command = [sys.executable, os.path.abspath(__file__), '--child', str(messages), '--seed', str(seed),
+               '--user', user, '--data-dir', data_dir]
+    output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output)
+
+
+def diff(results, baseline, tolerance):
+    """
+    Compare results with a saved baseline, stage by stage. Returns the
+    printed lines and whether any stage got slower or bigger than tolerance.
+    """
+    lines = []
+    regressed = False
+    for size, result in results.items():
+        base = baseline.get(size)
+        if base is None:
+            lines.append(f"{size} messages: not in baseline")
+            continue
+
+        lines.append(f"{size} messages:")
+        for name, stage in result['stages'].items():
+            before = base['stages'].get(name)
+            if before is None:
+                lines.append(f"  {name:32} new stage")
+                continue
+
+            time_ratio = stage['seconds'] / before['seconds'] if before['seconds'] else 1.0
+            rss_ratio = stage['peak_rss_mb'] / before['peak_rss_mb'] if before['peak_rss_mb'] else 1.0
+            slower = time_ratio > 1 + tolerance and max(stage['seconds'], before['seconds']) >= NOISE_SECONDS
+            worse = slower or rss_ratio > 1 + tolerance
+            regressed = regressed or worse
+            lines.append(f"  {name:32} {before['seconds']:9.3f}s -> {stage['seconds']:9.3f}s ({time_ratio:5.2f}x)"
+                         f"  {before['peak_rss_mb']:8.1f} -> {stage['peak_rss_mb']:8.1f} MB ({rss_ratio:5.2f}x)"
+                         f"{'  REGRESSION' if worse else ''}")
+
+    return lines, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parsing and helpers on synthetic exports.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="chat sizes in messages")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--user', default='Overall', help="user passed to the per-user helpers")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="where generated exports are kept")
+    parser.add_argument('-o', '--output', help="save the results as JSON, e.g. as the next baseline")
+    parser.add_argument('--baseline', help="results JSON of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="slowdown or memory growth reported as a regression (0.2 = 20%%)")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        json.dump(run_size(args.child, args.seed, args.user, args.data_dir), sys.stdout)
+        return 0
+
+    results = {}
+    for size in args.sizes:
+        print(f"benchmarking {size} messages...", file=sys.stderr)
+        results[str(size)] = result = run_isolated(size, args.seed, args.user, args.data_dir)
+
+        print(f"{size} messages ({result['rows']} rows, {result['file_mb']} MB): "
+              f"{result['total_seconds']:.2f}s, peak RSS {result['peak_rss_mb']} MB")
+        for name, stage in result['stages'].items():
+            print(f"  {name:32} {stage['seconds']:9.3f}s  {stage['peak_rss_mb']:8.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            lines, regressed = diff(results, json.load(f), args.tolerance)
+        print(f"\ncompared with {args.baseline}:")
+        print('\n'.join(lines))
+        return 1 if regressed else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
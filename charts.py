@@ -0,0 +1,192 @@
+# Chart rendering for the app: every chart is drawn off-screen and returned as PNG bytes
+import io
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import seaborn as sns
+
+import instrumentation
+import parallel
+
+
+def _subplots(figsize):
+    # A figure and axes outside pyplot: no global "current figure" is shared
+    # between threads drawing at once, and nothing is left to close
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.subplots()
+
+
+def _to_png(fig):
+    # Serialize a figure to PNG bytes
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def sentiment_pie(sentiment_summary):
+    # Pie chart for sentiment distribution
+    fig, ax = _subplots((8, 6))
+    sentiment_counts = [sentiment_summary['positive'], sentiment_summary['negative'],
+                        sentiment_summary['neutral']]
+    colors = ['#2E8B57', '#DC143C', '#808080']
+    labels = ['Positive', 'Negative', 'Neutral']
+    wedges, texts, autotexts = ax.pie(sentiment_counts, labels=labels, colors=colors,
+                                      autopct='%1.1f%%', startangle=90)
+    ax.set_title('Sentiment Distribution')
+    return _to_png(fig)
+
+
+def sentiment_scores(sentiment_summary):
+    # Bar chart for sentiment scores
+    fig, ax = _subplots((8, 6))
+    categories = ['Positive', 'Negative', 'Neutral', 'Compound']
+    scores = [sentiment_summary['avg_positive'], sentiment_summary['avg_negative'],
+              sentiment_summary['avg_neutral'], sentiment_summary['avg_sentiment']]
+    colors = ['#2E8B57', '#DC143C', '#808080', '#4169E1']
+    bars = ax.bar(categories, scores, color=colors)
+    ax.set_title('Average Sentiment Scores')
+    ax.set_ylabel('Score')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def sentiment_timeline(sentiment_timeline):
+    fig, ax = _subplots((12, 6))
+    ax.plot(sentiment_timeline['date'], sentiment_timeline['sentiment_score'],
+            color='blue', alpha=0.7, linewidth=2)
+    ax.axhline(y=0, color='black', linestyle='--', alpha=0.5)
+    ax.fill_between(sentiment_timeline['date'], sentiment_timeline['sentiment_score'],
+                    where=(sentiment_timeline['sentiment_score'] > 0), color='green', alpha=0.3,
+                    label='Positive')
+    ax.fill_between(sentiment_timeline['date'], sentiment_timeline['sentiment_score'],
+                    where=(sentiment_timeline['sentiment_score'] < 0), color='red', alpha=0.3,
+                    label='Negative')
+    ax.set_title('Sentiment Over Time')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Sentiment Score')
+    ax.legend()
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def monthly_timeline(timeline):
+    # Monthly timeline plot
+    fig, ax = _subplots((10, 6))
+    ax.plot(timeline['time'], timeline['message'], color='orange', marker='o', linewidth=2)
+    ax.set_title('Monthly Message Activity')
+    ax.set_xlabel('Month-Year')
+    ax.set_ylabel('Number of Messages')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def daily_timeline(daily_timeline):
+    # Daily timeline plot
+    fig, ax = _subplots((10, 6))
+    ax.plot(daily_timeline['only_date'], daily_timeline['message'], color='pink', alpha=0.7)
+    ax.set_title('Daily Message Activity')
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Number of Messages')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def week_activity(busy_day):
+    fig, ax = _subplots((8, 6))
+    bars = ax.bar(busy_day.index, busy_day.values, color='lightblue', edgecolor='navy')
+    ax.set_title('Messages by Day of Week')
+    ax.set_xlabel('Day of Week')
+    ax.set_ylabel('Number of Messages')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def month_activity(busy_month):
+    fig, ax = _subplots((8, 6))
+    bars = ax.bar(busy_month.index, busy_month.values, color='lightcoral', edgecolor='darkred')
+    ax.set_title('Messages by Month')
+    ax.set_xlabel('Month')
+    ax.set_ylabel('Number of Messages')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def busy_users(x):
+    fig, ax = _subplots((10, 6))
+    bars = ax.bar(x.index, x.values, color='green', edgecolor='darkgreen')
+    ax.set_title('Messages by User')
+    ax.set_xlabel('Users')
+    ax.set_ylabel('Number of Messages')
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def wordcloud(df_wc):
+    fig, ax = _subplots((12, 8))
+    ax.imshow(df_wc, interpolation='bilinear')
+    ax.axis('off')
+    ax.set_title('Most Common Words Cloud', fontsize=16, pad=20)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def most_common_words(most_common_df):
+    fig, ax = _subplots((12, 8))
+    bars = ax.barh(most_common_df[0], most_common_df[1], color='skyblue', edgecolor='navy')
+    ax.set_title('Top 20 Most Common Words')
+    ax.set_xlabel('Frequency')
+    ax.set_ylabel('Words')
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def top_emojis(top_emojis):
+    fig, ax = _subplots((8, 6))
+    bars = ax.bar(range(len(top_emojis)), top_emojis[1], color='gold', edgecolor='orange')
+    ax.set_title('Top 10 Most Used Emojis')
+    ax.set_xlabel('Emoji Rank')
+    ax.set_ylabel('Usage Count')
+    ax.set_xticks(range(len(top_emojis)))
+    ax.set_xticklabels(top_emojis[0], fontsize=16)
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def activity_heatmap(user_heatmap):
+    fig, ax = _subplots((14, 8))
+    sns.heatmap(user_heatmap, annot=True, cmap='YlOrRd', ax=ax, fmt='g')
+    ax.set_title('Activity Heatmap: Messages by Day and Hour')
+    ax.set_xlabel('Time Period')
+    ax.set_ylabel('Day of Week')
+    fig.tight_layout()
+    return _to_png(fig)
+
+
+def draw(chart_name, data):
+    # Draw one chart by name, importable by worker processes
+    return globals()[chart_name](data)
+
+
+def render(chart_name, data, workers=None):
+    """
+    PNG bytes of one chart. With more than one worker the chart is drawn in
+    the shared process pool with the Agg backend: drawing holds the GIL, so
+    charts requested from several threads at once only render in parallel
+    in separate processes.
+    """
+    workers = workers or parallel.WORKERS
+    with instrumentation.stage(f"charts.{chart_name}", instrumentation.row_count(data)):
+        if workers <= 1:
+            return draw(chart_name, data)
+        return parallel.get_pool(workers).submit(draw, chart_name, data).result()
+
@@ -0,0 +1,146 @@
+# Content-addressed on-disk store of preprocessed chats
+import hashlib
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+import instrumentation
+import preprocessor
+
+try:
+    import pyarrow as pa
+    from pyarrow import feather
+except ImportError:  # cache is disabled without pyarrow
+    pa = None
+
+# Where parsed chats are stored and how much disk they may use
+CACHE_DIR = os.environ.get('WA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'whatsapp_chat_cache'))
+MAX_CACHE_BYTES = int(os.environ.get('WA_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+# Temporary files older than this, in seconds, are left over from writes
+# that never finished and are removed by evict()
+STALE_TMP_SECONDS = 3600
+
+
+def chat_key(bytes_data):
+    # Key a chat by the hash of its raw export bytes
+    return hashlib.sha256(bytes_data).hexdigest()
+
+
+def _cache_path(key, cache_dir):
+    return os.path.join(cache_dir, f"{key}-v{preprocessor.SCHEMA_VERSION}.feather")
+
+
+@instrumentation.instrument
+def load_chat(bytes_data, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """
+    Return the preprocessed DataFrame for an export, parsing it only when no
+    cached copy exists for the same bytes and schema version
+    """
+    if pa is None:
+        return preprocessor.preprocess(_decode(bytes_data))
+
+    path = _cache_path(chat_key(bytes_data), cache_dir)
+    df = _read(path)
+    if df is not None:
+        return df
+
+    df = preprocessor.preprocess(_decode(bytes_data))
+    _write(df, path)
+    evict(cache_dir, max_bytes)
+
+    return df
+
+
+def _decode(bytes_data):
+    with instrumentation.stage('chat_cache.decode', bytes=len(bytes_data)):
+        return bytes_data.decode("utf-8")
+
+
+@instrumentation.instrument
+def _read(path):
+    try:
+        table = feather.read_table(path, memory_map=True)
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+    # Refresh the access time used for LRU eviction, unless another upload
+    # has evicted the entry since it was opened
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+    df = table.to_pandas()
+
+    # Arrow strings come back as pandas' str dtype, while a fresh parse holds
+    # them as objects; cast back so first and repeat loads give the same frame
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.StringDtype):
+            df[column] = df[column].astype(object)
+
+    return df
+
+
+@instrumentation.instrument
+def _write(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Write to a temporary file first so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        feather.write_feather(df.reset_index(drop=True), tmp_path, compression='uncompressed')
+        os.replace(tmp_path, path)
+    except (OSError, pa.ArrowException):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _remove(path):
+    # Another upload evicting at the same time may have removed it already
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """
+    Remove entries written by older schema versions and temporary files
+    left by failed writes, then the least recently used entries until the
+    cache fits in max_bytes. Entries removed by a concurrent eviction are
+    skipped.
+    """
+    if not os.path.isdir(cache_dir):
+        return
+
+    suffix = f"-v{preprocessor.SCHEMA_VERSION}.feather"
+    now = time.time()
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+
+        if name.endswith('.tmp'):
+            if now - stat.st_mtime > STALE_TMP_SECONDS:
+                _remove(path)
+            continue
+        if not name.endswith('.feather'):
+            continue
+        if not name.endswith(suffix):
+            _remove(path)
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
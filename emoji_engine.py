@@ -0,0 +1,136 @@
+# Longest-match emoji extraction that keeps multi-codepoint sequences whole
+import re
+import sys
+import time
+from collections import Counter
+
+import emoji
+import numpy as np
+
+
+def build_emoji_trie(emojis=None):
+    """
+    Build a character trie of every emoji in emoji.EMOJI_DATA, so ZWJ
+    sequences, skin tones, keycaps and flags can be matched as one emoji.
+    Returns the trie and a compiled pattern matching candidate runs.
+    """
+    trie = {}
+    for sequence in (emojis or emoji.EMOJI_DATA):
+        node = trie
+        for char in sequence:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    # Every emoji contains a non-ASCII character and only keycaps start with an
+    # ASCII one, so candidates are an optional keycap base followed by a run of
+    # non-ASCII characters. A negated ASCII range is much cheaper for re to test
+    # than a class of every emoji code point; split_run() does the exact match.
+    keycap_starts = ''.join(re.escape(char) for char in sorted(trie) if char.isascii())
+    run_pattern = re.compile(f"[{keycap_starts}]?[^\\x00-\\x7f]+")
+
+    return trie, run_pattern
+
+
+EMOJI_TRIE, EMOJI_RUN = build_emoji_trie()
+
+
+def split_run(run):
+    """
+    Split a candidate run into emojis, always taking the longest sequence in
+    the trie and skipping characters that start none
+    """
+    found = []
+    pos = 0
+    while pos < len(run):
+        node = EMOJI_TRIE
+        end = None
+        i = pos
+        while i < len(run) and run[i] in node:
+            node = node[run[i]]
+            i += 1
+            if '' in node:
+                end = i
+
+        if end is None:
+            pos += 1
+        else:
+            found.append(run[pos:end])
+            pos = end
+
+    return found
+
+
+def find_emojis(message):
+    # Emoji sequences used in one message, in order
+    return [e for run in EMOJI_RUN.findall(message) for e in split_run(run)]
+
+
+def count_emojis(messages):
+    """
+    Counter of emoji sequences in a list of messages. The regex runs once over
+    the joined text and each distinct run is split only once.
+    """
+    runs = Counter(EMOJI_RUN.findall('\n'.join(messages)))
+
+    emojis = Counter()
+    for run, count in runs.items():
+        for e in split_run(run):
+            emojis[e] += count
+
+    return emojis
+
+
+def count_emojis_by_user(messages, users):
+    """
+    Emoji counts per user in a single pass over the joined text. Returns a
+    Counter keyed by (user, emoji).
+    """
+    messages = list(messages)
+    users = list(users)
+
+    # Offset of every message in the joined text, to map runs back to senders
+    lengths = np.fromiter((len(message) + 1 for message in messages), dtype='int64', count=len(messages))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    text = '\n'.join(messages)
+    matches = [(match.start(), match.group()) for match in EMOJI_RUN.finditer(text)]
+    owners = np.searchsorted(starts, [start for start, _ in matches], side='right') - 1
+
+    runs = Counter((users[owner], run) for owner, (_, run) in zip(owners, matches))
+
+    emojis = Counter()
+    split_cache = {}
+    for (user, run), count in runs.items():
+        if run not in split_cache:
+            split_cache[run] = split_run(run)
+        for e in split_cache[run]:
+            emojis[(user, e)] += count
+
+    return emojis
+
+
+if __name__ == '__main__':
+    # Benchmark against the per-character check: python emoji_engine.py <exported chat.txt>
+    import preprocessor
+
+    with open(sys.argv[1], encoding='utf-8') as f:
+        df = preprocessor.preprocess(f.read())
+    messages = df['message'].tolist()
+
+    start = time.perf_counter()
+    per_char = Counter(c for message in messages for c in message if c in emoji.EMOJI_DATA)
+    per_char_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sequences = count_emojis(messages)
+    sequence_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    by_user = count_emojis_by_user(messages, df['user'])
+    by_user_seconds = time.perf_counter() - start
+
+    print(f"messages: {len(messages)}")
+    print(f"per-character check: {per_char_seconds:.3f}s, {sum(per_char.values())} emojis, {len(per_char)} distinct")
+    print(f"sequence engine:     {sequence_seconds:.3f}s, {sum(sequences.values())} emojis, {len(sequences)} distinct")
+    print(f"per-user counts:     {by_user_seconds:.3f}s, {len(by_user)} (user, emoji) pairs")
+    print(f"multi-codepoint sequences: {sum(n for e, n in sequences.items() if len(e) > 1)}")
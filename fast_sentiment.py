@@ -0,0 +1,148 @@
+# Vectorized batch approximation of VADER sentiment scoring
+import string
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from vaderSentiment.vaderSentiment import (SentimentIntensityAnalyzer, BOOSTER_DICT, NEGATE,
+                                           N_SCALAR)
+
+# VADER lexicon, emoji descriptions and the columns returned by score_messages()
+analyzer = SentimentIntensityAnalyzer()
+SENTIMENT_COLUMNS = ['pos', 'neg', 'neu', 'compound']
+
+# Emojis are replaced by their textual description, as polarity_scores() does
+EMOJI_TABLE = str.maketrans({char: f" {description} " for char, description in analyzer.emojis.items()
+                             if len(char) == 1})
+
+# Damping applied to a booster word one, two and three positions before a lexicon word
+BOOSTER_DAMPING = [1.0, 0.95, 0.9]
+
+
+def score_messages(messages):
+    """
+    Score a Series of messages in one batch. Implements VADER's lexicon lookup,
+    booster words, negation of the three preceding words and punctuation
+    emphasis with NumPy over all tokens at once. The rarer rules (ALL CAPS,
+    "but", idioms, "least", "no") are not applied, so scores approximate
+    polarity_scores(); agreement_report() measures how closely.
+    """
+    texts = messages.astype(str).reset_index(drop=True)
+    n = len(texts)
+    if n == 0:
+        return pd.DataFrame(columns=SENTIMENT_COLUMNS, index=messages.index, dtype=float)
+
+    # Tokenize every message together: one row per token, indexed by message position
+    tokens = texts.str.translate(EMOJI_TABLE).str.split().explode().dropna()
+    stripped = tokens.str.strip(string.punctuation)
+    tokens = stripped.where(stripped.str.len() > 2, tokens)
+    lower = tokens.str.lower()
+
+    msg_id = tokens.index.to_numpy()
+    in_lexicon = lower.isin(analyzer.lexicon).to_numpy()
+    booster = lower.map(BOOSTER_DICT).fillna(0.0).to_numpy(dtype=float)
+    negation = (lower.isin(NEGATE) | lower.str.contains("n't", regex=False)).to_numpy()
+
+    # Booster words carry no valence of their own
+    valence = lower.map(analyzer.lexicon).fillna(0.0).to_numpy(dtype=float)
+    valence = np.where(booster != 0, 0.0, valence)
+    is_sentiment = in_lexicon & (booster == 0)
+
+    # Apply modifiers from the three preceding tokens of the same message
+    for k in range(1, 4):
+        same_msg = np.zeros(len(msg_id), dtype=bool)
+        same_msg[k:] = msg_id[k:] == msg_id[:-k]
+        prev = np.zeros(len(msg_id), dtype=int)
+        prev[k:] = np.arange(len(msg_id) - k)
+        applies = is_sentiment & same_msg & ~in_lexicon[prev]
+
+        boost = booster[prev] * np.sign(valence) * BOOSTER_DAMPING[k - 1]
+        valence = np.where(applies, valence + boost, valence)
+        valence = np.where(applies & negation[prev], valence * N_SCALAR, valence)
+
+    # Per-message sums over tokens
+    token_count = np.bincount(msg_id, minlength=n)
+    sum_s = np.bincount(msg_id, weights=valence, minlength=n)
+    pos_sum = np.bincount(msg_id, weights=np.where(valence > 0, valence + 1, 0.0), minlength=n)
+    neg_sum = np.bincount(msg_id, weights=np.where(valence < 0, valence - 1, 0.0), minlength=n)
+    neu_count = np.bincount(msg_id, weights=(valence == 0).astype(float), minlength=n)
+
+    # Emphasis from exclamation points and question marks
+    ep_count = np.minimum(texts.str.count(r'!').to_numpy(), 4)
+    qm_count = texts.str.count(r'\?').to_numpy()
+    qm_amplifier = np.where(qm_count > 1, np.where(qm_count <= 3, qm_count * 0.18, 0.96), 0.0)
+    amplifier = ep_count * 0.292 + qm_amplifier
+
+    sum_s = sum_s + np.sign(sum_s) * amplifier
+    compound = np.clip(sum_s / np.sqrt(sum_s * sum_s + 15), -1.0, 1.0)
+
+    pos_wins = pos_sum > np.abs(neg_sum)
+    neg_wins = pos_sum < np.abs(neg_sum)
+    pos_sum = np.where(pos_wins, pos_sum + amplifier, pos_sum)
+    neg_sum = np.where(neg_wins, neg_sum - amplifier, neg_sum)
+    total = pos_sum + np.abs(neg_sum) + neu_count
+
+    # Messages without tokens score zero everywhere, as in VADER
+    has_tokens = token_count > 0
+    safe_total = np.where(has_tokens, total, 1.0)
+    scores = pd.DataFrame({
+        'pos': np.where(has_tokens, np.abs(pos_sum / safe_total), 0.0).round(3),
+        'neg': np.where(has_tokens, np.abs(neg_sum / safe_total), 0.0).round(3),
+        'neu': np.where(has_tokens, np.abs(neu_count / safe_total), 0.0).round(3),
+        'compound': np.where(has_tokens, compound, 0.0).round(4)
+    }, columns=SENTIMENT_COLUMNS)
+    scores.index = messages.index
+
+    return scores
+
+
+def classify(compound):
+    # Same thresholds as helper.sentiment_analysis
+    return np.where(compound >= 0.05, 'positive', np.where(compound <= -0.05, 'negative', 'neutral'))
+
+
+def agreement_report(messages):
+    """
+    Compare the batch engine with polarity_scores() on the same messages and
+    report class-level agreement, compound error and timings
+    """
+    start = time.perf_counter()
+    exact = pd.DataFrame([analyzer.polarity_scores(message) for message in messages], columns=SENTIMENT_COLUMNS)
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = score_messages(messages).reset_index(drop=True)
+    batch_seconds = time.perf_counter() - start
+
+    exact_class = classify(exact['compound'].to_numpy())
+    batch_class = classify(batch['compound'].to_numpy())
+    error = np.abs(exact['compound'].to_numpy() - batch['compound'].to_numpy())
+
+    per_class = {}
+    for label in ['positive', 'negative', 'neutral']:
+        mask = exact_class == label
+        per_class[label] = float((batch_class[mask] == label).mean()) if mask.any() else None
+
+    return {
+        'messages': len(messages),
+        'class_agreement': float((exact_class == batch_class).mean()) if len(messages) else None,
+        'class_recall': per_class,
+        'compound_mae': float(error.mean()) if len(messages) else None,
+        'compound_max_error': float(error.max()) if len(messages) else None,
+        'exact_seconds': exact_seconds,
+        'batch_seconds': batch_seconds
+    }
+
+
+if __name__ == '__main__':
+    # Agreement benchmark: python fast_sentiment.py <exported chat.txt>
+    import preprocessor
+    import helper
+
+    with open(sys.argv[1], encoding='utf-8') as f:
+        df = preprocessor.preprocess(f.read())
+
+    report = agreement_report(helper.sentiment_messages(df)['message'])
+    for key, value in report.items():
+        print(f"{key}: {value}")
@@ -1,38 +1,211 @@
 # Import necessary libraries
-from wordcloud import WordCloud
 import pandas as pd
-from collections import Counter
+from collections import Counter, OrderedDict
 from urlextract import URLExtract
-import emoji
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 import numpy as np
+import os
+import re
+import threading
+import weakref
+import emoji_engine
+import fast_sentiment
+import instrumentation
+import preprocessor
+import parallel
 
 # Initialize URL extractor
 extract = URLExtract()
 analyzer = SentimentIntensityAnalyzer()
+
+# Structures derived from each chat frame (user index, feature and sentiment
+# tables, activity cube), keyed by id(df) and dropped when the frame is freed.
+# The frame itself is never modified: the app shares it between sessions and
+# threads, so derived columns are kept here as tables aligned with it.
+_chat_states = {}
+_chat_states_lock = threading.Lock()
+
+# Per-message text features of a chat, as computed by message_features()
+FEATURE_COLUMNS = ['word_count', 'url_count', 'is_media']
+
+# Stop words left out of the most common words and the word cloud, read once
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stop_hinglish.txt'), 'r') as f:
+    STOP_WORDS = frozenset(f.read().split('\n'))
+
+# Messages without '://' or a dot followed by a TLD-like token cannot hold a URL
+URL_CANDIDATE = re.compile(r'://|\.[^\W\d_]{2}')
+
+# VADER scores of a chat's messages, as computed by message_sentiment()
+SENTIMENT_COLUMNS = ['pos', 'neg', 'neu', 'compound']
+
+# Sentiment engine: 'vader' runs polarity_scores() per distinct message,
+# 'batch' uses the vectorized lexicon approximation in fast_sentiment
+SENTIMENT_ENGINE = os.environ.get('WA_SENTIMENT_ENGINE', 'vader')
+
+# Number of distinct message texts whose scores are kept between chats
+SENTIMENT_MEMO_SIZE = 200000
+
+# Scores of recently seen message texts, least recently used first. The memo
+# lives in this process and only its misses are sent to the worker pool, so
+# the hit counts stay accurate when scoring is sharded.
+_sentiment_memo = OrderedDict()
+_sentiment_memo_lock = threading.Lock()
+_sentiment_memo_stats = {'hits': 0, 'misses': 0}
+
+
+def chat_state(df):
+    """
+    Dict of structures derived from a chat frame, created the first time the
+    frame is seen and kept until it is freed
+    """
+    key = id(df)
+    entry = _chat_states.get(key)
+    if entry is not None and entry[0]() is df:
+        return entry[1]
+
+    # Threads rendering sections of the same chat must share one state
+    with _chat_states_lock:
+        entry = _chat_states.get(key)
+        if entry is not None and entry[0]() is df:
+            return entry[1]
+
+        state = {}
+        _chat_states[key] = (weakref.ref(df, lambda _: _chat_states.pop(key, None)), state)
+
+    return state
+
+
+def chat_lock(df, name):
+    """
+    Lock shared by every thread working on one chat frame. message_features()
+    and message_sentiment() hold their own lock while computing, so a chat is
+    scored once.
+    """
+    return chat_state(df).setdefault(f"{name}_lock", threading.Lock())
+
+
+@instrumentation.instrument
+def user_index(df):
+    """
+    Map every user to the row positions of their messages. Built with one
+    groupby the first time a chat frame is seen and reused until it is freed.
+    """
+    state = chat_state(df)
+    if 'user_index' not in state:
+        state['user_index'] = df.groupby('user', sort=False, observed=True).indices
+
+    return state['user_index']
+
+
+@instrumentation.instrument
+def select_user(df, selected_user):
+    """
+    Rows of df sent by selected_user, or df itself for 'Overall'. Costs
+    O(rows for that user) instead of comparing every row's user.
+    """
+    return select_rows(df, df, selected_user)
+
+
+def select_rows(table, df, selected_user):
+    """
+    Rows of a table aligned with the chat frame df, such as
+    message_features(df), that belong to selected_user's messages
+    """
+    if selected_user == 'Overall':
+        return table
+
+    positions = user_index(df).get(selected_user)
+    if positions is None:
+        return table.iloc[0:0]
+
+    return table.take(positions)
+
+
+def extract_features(messages):
+    """
+    Single pass over a list of messages returning the word count of each.
+    Emojis are counted per user by emoji_counts() in one pass over the
+    joined text instead.
+    """
+    return [len(message.split()) for message in messages]
+
+
+def _find_url_counts(messages):
+    # Shard worker for count_urls, one URL count per message
+    return [len(extract.find_urls(message)) for message in messages]
+
+
+@instrumentation.instrument
+def count_urls(messages):
+    """
+    Number of URLs in each message of a Series. A vectorized check for '://'
+    or a dot followed by letters picks the few messages that can hold a URL,
+    and only those are handed to URLExtract.
+    """
+    candidates = messages.str.contains(URL_CANDIDATE).to_numpy(dtype=bool)
+
+    counts = np.zeros(len(messages), dtype='int64')
+    counts[candidates] = parallel.run_sharded(_find_url_counts, messages[candidates], parallel.merge_lists)
+
+    return pd.Series(counts, index=messages.index)
+
+
+@instrumentation.instrument
+def message_features(df):
+    """
+    Per-message text features of a chat as a table aligned with df, so
+    fetch_stats only aggregates them. Like message_sentiment(), this runs
+    once per chat.
+    """
+    state = chat_state(df)
+    if 'features' in state:
+        return state['features']
+
+    with chat_lock(df, 'features'):
+        if 'features' not in state:
+            word_count = parallel.run_sharded(extract_features, df['message'], parallel.merge_lists)
+            state['features'] = pd.DataFrame({
+                'word_count': pd.Series(word_count, index=df.index, dtype='int64'),
+                'url_count': count_urls(df['message']),
+                'is_media': df['message'] == '<Media omitted>'
+            }, index=df.index)
+
+    return state['features']
+
+
+@instrumentation.instrument
 def fetch_stats(selected_user, df):
-    # Filter data for the selected user if not 'Overall'
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    # Filter the features for the selected user if not 'Overall'
+    features = select_rows(message_features(df), df, selected_user)
 
     # Calculate the number of messages
-    num_messages = df.shape[0]
+    num_messages = features.shape[0]
 
     # Calculate the number of words
-    words = []
-    for message in df['message']:
-        words.extend(message.split())
+    words = int(features['word_count'].sum())
 
     # Calculate the number of media messages
-    no_media_msg = df[df['message'] == '<Media omitted>'].shape[0]
+    no_media_msg = int(features['is_media'].sum())
 
     # Calculate the number of links
-    links = []
-    for message in df['message']:
-        links.extend(extract.find_urls(message))
+    no_links = int(features['url_count'].sum())
 
-    return num_messages, len(words), no_media_msg, len(links)
+    return num_messages, words, no_media_msg, no_links
 
+
+@instrumentation.instrument
+def link_counts(df):
+    """
+    Links shared per user and per day, read from the url_count feature
+    """
+    url_count = message_features(df)['url_count']
+
+    by_user = url_count.groupby(df['user'], observed=True).sum()
+    by_day = url_count.groupby(df['date'].dt.normalize().rename('only_date')).sum()
+
+    return by_user, by_day
+
+@instrumentation.instrument
 def most_busy_users(df):
     # Find the top users by message count
     x = df['user'].value_counts().head()
@@ -43,141 +216,400 @@ def most_busy_users(df):
 
     return x, df
 
+@instrumentation.instrument
+def user_leaderboard(df):
+    """
+    One row per sender with messages, share of the chat, words, media,
+    links, emojis, average sentiment and sentiment class counts, most active
+    first. Built with a single groupby over the feature and sentiment
+    tables, plus the per-user emoji counts, the first time a chat is seen;
+    sentiment only counts the messages sentiment_messages() keeps.
+    """
+    state = chat_state(df)
+    if 'leaderboard' in state:
+        return state['leaderboard'].copy()
+
+    features = message_features(df)
+
+    scored = sentiment_mask(df)
+    compound = message_sentiment(df)['compound'].where(scored, 0.0)
+    rows = pd.DataFrame({
+        'messages': 1,
+        'words': features['word_count'],
+        'media': features['is_media'].astype('int64'),
+        'links': features['url_count'],
+        'compound': compound,
+        'positive': (scored & (compound >= 0.05)).astype('int64'),
+        'negative': (scored & (compound <= -0.05)).astype('int64'),
+        'neutral': (scored & (compound > -0.05) & (compound < 0.05)).astype('int64'),
+        'scored': scored.astype('int64')
+    }, index=df.index)
+    board = rows.groupby(df['user'], observed=True).sum()
+    board.index = board.index.astype(str)
+    board = board.drop(index='group_notification', errors='ignore')
+    board['emojis'] = [sum(emoji_counts(df).get(user, Counter()).values()) for user in board.index]
+
+    board.insert(1, 'percent', (board['messages'] / len(df) * 100).round(2))
+    board['avg_sentiment'] = board['compound'] / board['scored'].where(board['scored'] > 0)
+    board = board[['messages', 'percent', 'words', 'media', 'links', 'emojis', 'avg_sentiment',
+                   'positive', 'negative', 'neutral']]
+    board = board.sort_values('messages', ascending=False, kind='stable')
+    state['leaderboard'] = board
+
+    return board.copy()
+
+@instrumentation.instrument
+def word_frequencies(selected_user, df):
+    """
+    Counter of the lowercased words a user (or everyone, for 'Overall') wrote,
+    without stop words and media messages. All users are counted in one
+    vectorized pass the first time a chat is seen; most_common_words and
+    create_wordcloud both read these counts.
+    """
+    state = chat_state(df)
+    if 'word_frequencies' not in state:
+        temp = df[df['message'] != '<Media omitted>']
+        words = pd.DataFrame({'user': temp['user'], 'word': temp['message'].str.lower().str.split()})
+        words = words.explode('word').dropna(subset=['word'])
+        words = words[~words['word'].isin(STOP_WORDS)]
+
+        # Groups in order of first use, so ties keep the chat order as Counter does
+        counts = words.groupby(['user', 'word'], observed=True, sort=False).size()
+        counts = counts.sort_values(ascending=False, kind='stable')
+        frequencies = {user: Counter(user_counts.droplevel(0).to_dict())
+                       for user, user_counts in counts.groupby(level=0, observed=True)}
+        frequencies['Overall'] = Counter(words['word'].value_counts().to_dict())
+        state['word_frequencies'] = frequencies
+
+    return state['word_frequencies'].get(selected_user, Counter())
+
+@instrumentation.instrument
 def create_wordcloud(selected_user, df):
-    # Read stop words for word cloud
-    with open('stop_hinglish.txt', 'r') as f:
-        stop_words = f.read()
+    # Word counts of the selected user, shared with most_common_words
+    frequencies = word_frequencies(selected_user, df)
 
-    # Filter data for the selected user if not 'Overall'
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    # WordCloud needs at least one word, e.g. not only media or stop words
+    if not frequencies:
+        return None
+
+    # Imported here because wordcloud pulls in matplotlib, which headless
+    # callers such as batch.py never need
+    from wordcloud import WordCloud
 
     # Generate the word cloud
     wc = WordCloud(width=500, height=500, min_font_size=10, background_color='white')
-    df_wc = wc.generate(df['message'].str.cat(sep=" "))
+    df_wc = wc.generate_from_frequencies(frequencies)
 
     return df_wc
 
+@instrumentation.instrument
 def most_common_words(selected_user, df):
-    # Read stop words for common words analysis
-    with open('stop_hinglish.txt', 'r') as f:
-        stop_words = f.read()
-    stop_words = stop_words.split('\n')
-
-    # Filter data for the selected user if not 'Overall'
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
-
-    # Create a list of words excluding stop words and media messages
-    temp = df[df['message'] != '<Media omitted>']
-    words = []
-    for message in temp['message']:
-        for word in message.lower().split():
-            if word not in stop_words:
-                words.append(word)
+    # Word counts of the selected user, shared with create_wordcloud
+    words = word_frequencies(selected_user, df)
 
     # Get the most common words
-    most_common_df = pd.DataFrame(Counter(words).most_common(20))
+    most_common_df = pd.DataFrame(words.most_common(20))
 
     return most_common_df
 
-def emoji_helper(selected_user, df):
-    # Filter data for the selected user if not 'Overall'
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+@instrumentation.instrument
+def emoji_counts(df):
+    """
+    Counter of the emojis of every user and of 'Overall', from a single
+    pass over the joined messages. Counters list emojis in the order they
+    first appear in the chat, so ties keep that order.
+    """
+    state = chat_state(df)
+    if 'emoji_counts' not in state:
+        counts = {'Overall': Counter()}
+        for (user, e), count in emoji_engine.count_emojis_by_user(df['message'], df['user']).items():
+            counts.setdefault(user, Counter())[e] += count
+            counts['Overall'][e] += count
+        state['emoji_counts'] = counts
 
-    # Count the emojis used
-    emojis = []
-    for message in df['message']:
-        emojis.extend([c for c in message if c in emoji.EMOJI_DATA])
+    return state['emoji_counts']
+
+@instrumentation.instrument
+def emoji_helper(selected_user, df):
+    # Emoji counts of the selected user, shared by every user of the chat
+    emojis = emoji_counts(df).get(selected_user, Counter())
 
     # Create a DataFrame with emoji counts
-    emoji_df = pd.DataFrame(Counter(emojis).most_common(len(Counter(emojis))))
+    emoji_df = pd.DataFrame(emojis.most_common(len(emojis)))
 
     return emoji_df
 
-def monthly_timeline(selected_user, df):
-    # Filter data for the selected user if not 'Overall'
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+@instrumentation.instrument
+def emoji_counts_by_user(df):
+    """
+    Emoji usage of every user at once, as a DataFrame of user, emoji and
+    count sorted by user and descending count
+    """
+    rows = [(user, e, count) for user, emojis in emoji_counts(df).items() if user != 'Overall'
+            for e, count in emojis.items()]
+    counts = pd.DataFrame(rows, columns=['user', 'emoji', 'count'])
+
+    return counts.sort_values(['user', 'count', 'emoji'], ascending=[True, False, True], ignore_index=True)
+
+@instrumentation.instrument
+def activity_cube(df):
+    """
+    Message counts computed once per chat: `daily` is users x calendar days
+    and `weekly` is users x weekday x hour. Every timeline, activity map and
+    heatmap is a slice and sum of these arrays.
+    """
+    state = chat_state(df)
+    if 'activity' in state:
+        return state['activity']
+
+    codes, users = pd.factorize(df['user'])
+    dates = df['date']
+    n_users = len(users)
+
+    # Position of every message's day in a contiguous calendar
+    days = dates.dt.normalize()
+    if len(df):
+        calendar = pd.date_range(days.min(), days.max(), freq='D')
+        day_pos = ((days - days.min()) // pd.Timedelta(days=1)).to_numpy(dtype='int64')
+    else:
+        calendar = pd.DatetimeIndex([])
+        day_pos = np.zeros(0, dtype='int64')
+    n_days = len(calendar)
+
+    daily = np.bincount(codes * n_days + day_pos, minlength=n_users * n_days)
+    slots = dates.dt.dayofweek.to_numpy(dtype='int64') * 24 + dates.dt.hour.to_numpy(dtype='int64')
+    weekly = np.bincount(codes * 168 + slots, minlength=n_users * 168)
+
+    cube = {
+        'users': {user: code for code, user in enumerate(users)},
+        'calendar': calendar,
+        'daily': daily.reshape(n_users, n_days).astype('int32'),
+        'weekly': weekly.reshape(n_users, 7, 24).astype('int32')
+    }
+    state['activity'] = cube
+
+    return cube
+
 
-    # Group by year and month to create a timeline
-    timeline = df.groupby(['year', 'month_num', 'month']).count()['message'].reset_index()
+@instrumentation.instrument
+def user_activity(selected_user, df):
+    # Daily and weekday x hour counts of one user, or of everyone for 'Overall'
+    cube = activity_cube(df)
 
-    # Create a new column combining year and month for display
-    time = []
-    for i in range(timeline.shape[0]):
-        time.append(timeline['month'][i] + "-" + str(timeline['year'][i]))
-    timeline['time'] = time
+    if selected_user == 'Overall':
+        return cube['daily'].sum(axis=0), cube['weekly'].sum(axis=0), cube['calendar']
+
+    code = cube['users'].get(selected_user)
+    if code is None:
+        return np.zeros(len(cube['calendar']), dtype='int32'), np.zeros((7, 24), dtype='int32'), cube['calendar']
+
+    return cube['daily'][code], cube['weekly'][code], cube['calendar']
+
+
+# Views over one user's activity: `daily` counts over a contiguous
+# `calendar` and `weekly` weekday x hour counts, as returned by
+# user_activity() here and in incremental.py
+
+def monthly_view(daily, calendar):
+    # Sum the days of each year and month to create a timeline
+    counts = pd.Series(daily, index=calendar).groupby([calendar.year, calendar.month]).sum()
+    counts = counts[counts > 0]
+
+    timeline = pd.DataFrame({
+        'year': counts.index.get_level_values(0),
+        'month_num': counts.index.get_level_values(1),
+        'message': counts.to_numpy()
+    })
+    timeline.insert(2, 'month', [preprocessor.MONTH_NAMES[month_num - 1] for month_num in timeline['month_num']])
+
+    # Create a new column combining year and month for display, one label per
+    # month of activity rather than per message
+    timeline['time'] = [f"{month}-{year}" for month, year in zip(timeline['month'], timeline['year'])]
 
     return timeline
 
-def daily_timeline(selected_user, df):
-    # Filter data for the selected user if not 'Overall'
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
 
-    # Group by date to create a daily timeline
-    daily_timeline = df.groupby('only_date').count()['message'].reset_index()
+def daily_view(daily, calendar):
+    # Keep the days with messages to create a daily timeline
+    active = daily > 0
+    return pd.DataFrame({'only_date': calendar[active], 'message': daily[active]})
 
-    return daily_timeline
 
-def week_activity_map(selected_user, df):
-    # Filter data for the selected user if not 'Overall'
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+def weekday_view(weekly):
+    # Sum the hours of each weekday to create a weekly activity map
+    counts = pd.Series(weekly.sum(axis=1), index=pd.Index(preprocessor.DAY_NAMES, name='day_name'), name='count')
+    return counts[counts > 0].sort_values(ascending=False, kind='stable')
 
-    # Group by day name to create a weekly activity map
-    return df['day_name'].value_counts()
 
-def month_activity_map(selected_user, df):
-    # Filter data for the selected user if not 'Overall'
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+def month_name_view(daily, calendar):
+    # Sum the days of each month name to create a monthly activity map
+    counts = np.bincount(calendar.month - 1, weights=daily, minlength=12).astype('int64')
+    counts = pd.Series(counts, index=pd.Index(preprocessor.MONTH_NAMES, name='month'), name='count')
+    return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+
+def heatmap_view(weekly):
+    # Create a heatmap for user activity based on day name and period
+    user_heatmap = pd.DataFrame(weekly.astype(float), index=pd.Index(preprocessor.DAY_NAMES, name='day_name'),
+                                columns=pd.Index(preprocessor.PERIODS, name='period'))
+
+    # Keep only the days and periods with any activity
+    return user_heatmap.loc[user_heatmap.sum(axis=1) > 0, user_heatmap.sum(axis=0) > 0]
+
+
+@instrumentation.instrument
+def monthly_timeline(selected_user, df):
+    daily, weekly, calendar = user_activity(selected_user, df)
+    return monthly_view(daily, calendar)
+
+@instrumentation.instrument
+def daily_timeline(selected_user, df):
+    daily, weekly, calendar = user_activity(selected_user, df)
+    return daily_view(daily, calendar)
 
-    # Group by month name to create a monthly activity map
-    return df['month'].value_counts()
+@instrumentation.instrument
+def week_activity_map(selected_user, df):
+    daily, weekly, calendar = user_activity(selected_user, df)
+    return weekday_view(weekly)
+
+@instrumentation.instrument
+def month_activity_map(selected_user, df):
+    daily, weekly, calendar = user_activity(selected_user, df)
+    return month_name_view(daily, calendar)
 
+@instrumentation.instrument
 def activity_heatmap(selected_user, df):
-    # Filter data for the selected user if not 'Overall'
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    daily, weekly, calendar = user_activity(selected_user, df)
+    return heatmap_view(weekly)
+
+
+def sentiment_mask(df):
+    # Rows that count in sentiment statistics: not media, group notifications or empty
+    return ((df['message'] != '<Media omitted>') &
+            (df['user'] != 'group_notification') &
+            (df['message'].str.strip() != '')).to_numpy()
+
+
+@instrumentation.instrument
+def sentiment_messages(df):
+    """
+    Filter out media messages, group notifications and empty messages,
+    which are left out of every sentiment statistic
+    """
+    return df[sentiment_mask(df)]
 
-    # Create a heatmap for user activity based on day name and period
-    user_heatmap = df.pivot_table(index='day_name', columns='period', values='message', aggfunc='count').fillna(0)
 
-    return user_heatmap
+def _score_texts(messages):
+    # Shard worker for score_messages, one VADER score tuple per message
+    scores = []
+    for message in messages:
+        polarity = analyzer.polarity_scores(message)
+        scores.append(tuple(polarity[column] for column in SENTIMENT_COLUMNS))
+    return scores
 
 
+def _memoized_scores(texts):
+    """
+    VADER scores of distinct texts: texts scored before (by any chat) come
+    from the memo, the rest are scored, sharded over the pool when large
+    """
+    with _sentiment_memo_lock:
+        rows = [_sentiment_memo.get(text) for text in texts]
+        for text, row in zip(texts, rows):
+            if row is not None:
+                _sentiment_memo.move_to_end(text)
+
+    missing = [i for i, row in enumerate(rows) if row is None]
+    scored = parallel.run_sharded(_score_texts, [texts[i] for i in missing], parallel.merge_lists)
+
+    with _sentiment_memo_lock:
+        _sentiment_memo_stats['hits'] += len(texts) - len(missing)
+        _sentiment_memo_stats['misses'] += len(missing)
+        for i, row in zip(missing, scored):
+            rows[i] = _sentiment_memo[texts[i]] = row
+        while len(_sentiment_memo) > SENTIMENT_MEMO_SIZE:
+            _sentiment_memo.popitem(last=False)
+
+    return rows
+
+
+@instrumentation.instrument
+def score_messages(messages, engine=None):
+    """
+    Score a Series of messages with VADER, running each distinct text only once
+    and broadcasting the scores back to every copy
+    """
+    engine = engine or SENTIMENT_ENGINE
+    codes, uniques = pd.factorize(messages)
+
+    if engine == 'batch':
+        table = fast_sentiment.score_messages(pd.Series(uniques, dtype=object))[SENTIMENT_COLUMNS].to_numpy(dtype=float)
+    elif engine == 'vader':
+        rows = _memoized_scores(list(uniques))
+        table = np.array(rows, dtype=float).reshape(-1, len(SENTIMENT_COLUMNS))
+    else:
+        raise ValueError(f"Unknown sentiment engine: {engine}")
+
+    return pd.DataFrame(table[codes], index=messages.index, columns=SENTIMENT_COLUMNS)
+
+
+def sentiment_memo_info():
+    """
+    Report how effective the cross-chat sentiment memo has been
+    """
+    with _sentiment_memo_lock:
+        hits, misses = _sentiment_memo_stats['hits'], _sentiment_memo_stats['misses']
+        size = len(_sentiment_memo)
+    lookups = hits + misses
+
+    return {
+        'hits': hits,
+        'misses': misses,
+        'size': size,
+        'max_size': SENTIMENT_MEMO_SIZE,
+        'hit_rate': hits / lookups if lookups else 0.0
+    }
+
+
+@instrumentation.instrument
+def message_sentiment(df, engine=None):
+    """
+    Score every analysable message once and return VADER's pos/neg/neu/compound
+    as a table aligned with df. All sentiment helpers read this table, so the
+    chat is only scored on the first call.
+    """
+    state = chat_state(df)
+    if 'sentiment' in state:
+        return state['sentiment']
+
+    with chat_lock(df, 'sentiment'):
+        if 'sentiment' not in state:
+            # Rows that are not scored are left as NaN
+            state['sentiment'] = score_messages(sentiment_messages(df)['message'], engine).reindex(df.index)
+
+    return state['sentiment']
+
+
+@instrumentation.instrument
 def sentiment_analysis(selected_user, df):
     """
     Perform sentiment analysis on messages using VADER sentiment analyzer
     Returns summary statistics of sentiment scores
     """
     # Filter data for the selected user if not 'Overall'
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    scores = select_rows(message_sentiment(df), df, selected_user)
+    df = select_user(df, selected_user)
 
-    # Filter out media messages and group notifications
-    filtered_df = df[(df['message'] != '<Media omitted>') &
-                     (df['user'] != 'group_notification') &
-                     (df['message'].str.strip() != '')]
+    # Sentiment scores precomputed for each message, without media messages
+    # and group notifications
+    sentiment_df = scores[sentiment_mask(df)]
 
-    if filtered_df.empty:
+    if sentiment_df.empty:
         return {
             'positive': 0, 'negative': 0, 'neutral': 100,
             'avg_positive': 0, 'avg_negative': 0, 'avg_neutral': 1, 'avg_sentiment': 0
         }
 
-    # Calculate sentiment scores for each message
-    sentiment_scores = []
-    for message in filtered_df['message']:
-        scores = analyzer.polarity_scores(message)
-        sentiment_scores.append(scores)
-
-    # Convert to DataFrame for easier analysis
-    sentiment_df = pd.DataFrame(sentiment_scores)
-
     # Classify messages based on compound score
     def classify_sentiment(compound_score):
         if compound_score >= 0.05:
@@ -187,10 +619,10 @@ def sentiment_analysis(selected_user, df):
         else:
             return 'neutral'
 
-    sentiment_df['sentiment_class'] = sentiment_df['compound'].apply(classify_sentiment)
+    sentiment_class = sentiment_df['compound'].apply(classify_sentiment)
 
     # Calculate percentages
-    sentiment_counts = sentiment_df['sentiment_class'].value_counts(normalize=True) * 100
+    sentiment_counts = sentiment_class.value_counts(normalize=True) * 100
 
     summary = {
         'positive': sentiment_counts.get('positive', 0),
@@ -205,39 +637,30 @@ def sentiment_analysis(selected_user, df):
     return summary
 
 
+@instrumentation.instrument
 def get_sentiment_dataframe(selected_user, df):
     """
     Get detailed sentiment analysis DataFrame
     """
     # Filter data for the selected user if not 'Overall'
-    if selected_user != 'Overall':
-        df = df[df['user'] == selected_user]
+    scores = select_rows(message_sentiment(df), df, selected_user)
+    df = select_user(df, selected_user)
 
     # Filter out media messages and group notifications
-    filtered_df = df[(df['message'] != '<Media omitted>') &
-                     (df['user'] != 'group_notification') &
-                     (df['message'].str.strip() != '')].copy()
+    keep = sentiment_mask(df)
+    filtered_df = df[keep]
 
     if filtered_df.empty:
         return pd.DataFrame()
 
-    # Calculate sentiment scores
-    sentiment_data = []
-    for idx, row in filtered_df.iterrows():
-        scores = analyzer.polarity_scores(row['message'])
-        sentiment_data.append({
-            'message': row['message'],
-            'user': row['user'],
-            'date': row['date'],
-            'positive': scores['pos'],
-            'negative': scores['neg'],
-            'neutral': scores['neu'],
-            'compound': scores['compound']
-        })
+    # Read the precomputed sentiment scores
+    sentiment_df = pd.concat([filtered_df[['message', 'user', 'date']], scores[keep]], axis=1).rename(
+        columns={'pos': 'positive', 'neg': 'negative', 'neu': 'neutral'})
 
-    return pd.DataFrame(sentiment_data)
+    return sentiment_df.reset_index(drop=True)
 
 
+@instrumentation.instrument
 def sentiment_timeline(selected_user, df):
     """
     Create a timeline of sentiment scores over time
@@ -257,66 +680,89 @@ def sentiment_timeline(selected_user, df):
     return timeline
 
 
-def get_extreme_sentiment_messages(selected_user, df, sentiment_type='positive', top_n=5):
+def _top_positions(values, k):
+    # Positions of the k largest values, largest first and earliest first on
+    # ties, selected in linear time instead of sorting every value
+    if k <= 0:
+        return np.zeros(0, dtype='int64')
+    if len(values) > k:
+        kth = np.partition(values, len(values) - k)[len(values) - k]
+        above = np.flatnonzero(values > kth)
+        ties = np.flatnonzero(values == kth)[:k - len(above)]
+        positions = np.concatenate([above, ties])
+    else:
+        positions = np.arange(len(values))
+
+    return positions[np.lexsort((positions, -values[positions]))]
+
+
+@instrumentation.instrument
+def extreme_sentiment_messages(df, top_n=5):
     """
-    Get messages with extreme sentiment scores (most positive or most negative)
+    The top_n most positive and most negative messages of every user and of
+    'Overall', as {user: {'positive': [(message, compound), ...],
+    'negative': [...]}}. Computed in one pass over the scored messages the
+    first time a chat is seen and kept with the chat for each top_n.
     """
-    sentiment_df = get_sentiment_dataframe(selected_user, df)
+    state = chat_state(df)
+    extremes = state.setdefault('extreme_sentiment', {})
+    if top_n in extremes:
+        return extremes[top_n]
 
-    if sentiment_df.empty:
-        return []
+    keep = sentiment_mask(df)
+    scored = df[keep]
+    compound = message_sentiment(df)['compound'].to_numpy(dtype='float64')[keep]
+    messages = scored['message'].to_numpy()
 
-    if sentiment_type == 'positive':
-        # Sort by compound score in descending order
-        sorted_df = sentiment_df.sort_values('compound', ascending=False)
-    else:
-        # Sort by compound score in ascending order
-        sorted_df = sentiment_df.sort_values('compound', ascending=True)
-
-    # Get top N messages
-    top_messages = []
-    for idx, row in sorted_df.head(top_n).iterrows():
+    def pick(positions):
         # Truncate very long messages
-        message = row['message']
-        if len(message) > 200:
-            message = message[:200] + "..."
-        top_messages.append((message, row['compound']))
+        picked = {}
+        for sentiment_type, values in [('positive', compound[positions]), ('negative', -compound[positions])]:
+            top = positions[_top_positions(values, top_n)]
+            picked[sentiment_type] = [(message[:200] + "..." if len(message) > 200 else message, float(score))
+                                      for message, score in zip(messages[top], compound[top])]
+        return picked
 
-    return top_messages
+    result = {user: pick(positions)
+              for user, positions in scored.groupby('user', sort=False, observed=True).indices.items()}
+    result['Overall'] = pick(np.arange(len(scored)))
+    extremes[top_n] = result
 
+    return result
 
-def sentiment_by_user(df):
+
+@instrumentation.instrument
+def get_extreme_sentiment_messages(selected_user, df, sentiment_type='positive', top_n=5):
     """
-    Get sentiment analysis grouped by user (for Overall analysis)
+    Get messages with extreme sentiment scores (most positive or most negative)
     """
-    # Filter out media messages and group notifications
-    filtered_df = df[(df['message'] != '<Media omitted>') &
-                     (df['user'] != 'group_notification') &
-                     (df['message'].str.strip() != '')]
-
-    if filtered_df.empty:
-        return pd.DataFrame()
+    extremes = extreme_sentiment_messages(df, top_n).get(selected_user)
+    if extremes is None:
+        return []
 
-    user_sentiment = {}
+    return extremes['positive' if sentiment_type == 'positive' else 'negative']
 
-    for user in filtered_df['user'].unique():
-        user_messages = filtered_df[filtered_df['user'] == user]
 
-        sentiment_scores = []
-        for message in user_messages['message']:
-            scores = analyzer.polarity_scores(message)
-            sentiment_scores.append(scores['compound'])
+@instrumentation.instrument
+def sentiment_by_user(df):
+    """
+    Get sentiment analysis grouped by user (for Overall analysis), read from
+    the per-user leaderboard
+    """
+    board = user_leaderboard(df)
+    board = board[board[['positive', 'negative', 'neutral']].sum(axis=1) > 0]
 
-        user_sentiment[user] = {
-            'avg_sentiment': np.mean(sentiment_scores),
-            'message_count': len(sentiment_scores),
-            'positive_messages': sum(1 for score in sentiment_scores if score >= 0.05),
-            'negative_messages': sum(1 for score in sentiment_scores if score <= -0.05),
-            'neutral_messages': sum(1 for score in sentiment_scores if -0.05 < score < 0.05)
-        }
+    if board.empty:
+        return pd.DataFrame()
 
-    # Convert to DataFrame
-    result_df = pd.DataFrame(user_sentiment).T
+    result_df = pd.DataFrame({
+        'avg_sentiment': board['avg_sentiment'],
+        'message_count': board[['positive', 'negative', 'neutral']].sum(axis=1),
+        'positive_messages': board['positive'],
+        'negative_messages': board['negative'],
+        'neutral_messages': board['neutral']
+    }).astype('float64')
+    result_df.index.name = None
     result_df = result_df.sort_values('avg_sentiment', ascending=False)
 
     return result_df
@@ -0,0 +1,345 @@
+# Incremental ingestion of re-exported chats into mergeable aggregates
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+import chat_cache
+import helper
+import instrumentation
+import preprocessor
+
+# Where the aggregates of every ingested chat are stored
+STORE_DIR = os.environ.get('WA_INCREMENTAL_DIR', os.path.join(chat_cache.CACHE_DIR, 'incremental'))
+
+# Leading bytes that identify a chat across re-exports. Exports shorter than
+# this are keyed by their full content and always parsed in full.
+KEY_BYTES = 4096
+
+# Bump whenever the layout of the aggregates changes
+AGGREGATE_VERSION = 1
+
+# Columns summed per user for the sentiment aggregates
+SENTIMENT_SUMS = ['pos', 'neg', 'neu', 'compound']
+
+
+def chat_id(bytes_data):
+    # Key of a chat: the hash of its first KEY_BYTES bytes, shared by every re-export
+    return hashlib.sha256(bytes_data[:KEY_BYTES]).hexdigest()
+
+
+def empty_aggregates():
+    """
+    Aggregates of a chat with no messages. Every value is a Counter or a
+    dict of Counters, so two aggregates merge by adding them up.
+    """
+    return {
+        'messages': Counter(),   # user -> messages
+        'words': Counter(),      # user -> words
+        'media': Counter(),      # user -> media messages
+        'links': Counter(),      # user -> links
+        'word_counts': {},       # user -> Counter of words (no stop words or media)
+        'emojis': {},            # user -> Counter of emojis
+        'sentiment': {},         # user -> Counter of score sums and class counts
+        'daily': Counter(),      # (user, date) -> messages
+        'weekly': Counter(),     # (user, weekday, hour) -> messages
+        'first_date': None,
+        'last_date': None
+    }
+
+
+@instrumentation.instrument
+def aggregate(df):
+    """
+    Mergeable aggregates of a parsed chat frame, built with the same helper
+    passes the app uses
+    """
+    aggregates = empty_aggregates()
+    if df.empty:
+        return aggregates
+
+    by_user = helper.message_features(df).groupby(df['user'], observed=True)
+    aggregates['messages'].update(by_user.size().to_dict())
+    aggregates['words'].update(by_user['word_count'].sum().to_dict())
+    aggregates['media'].update(by_user['is_media'].sum().to_dict())
+    aggregates['links'].update(by_user['url_count'].sum().to_dict())
+
+    for user in aggregates['messages']:
+        aggregates['word_counts'][user] = Counter(helper.word_frequencies(user, df))
+
+    for user, e, count in helper.emoji_counts_by_user(df).itertuples(index=False):
+        aggregates['emojis'].setdefault(user, Counter())[e] = count
+
+    # Score sums and class counts over the messages sentiment helpers use
+    keep = helper.sentiment_mask(df)
+    scored = df[keep]
+    scores = helper.message_sentiment(df)[keep]
+    compound = scores['compound']
+    classes = pd.DataFrame({
+        'user': scored['user'],
+        'count': 1,
+        'positive': (compound >= 0.05).astype(int),
+        'negative': (compound <= -0.05).astype(int),
+        'neutral': ((compound > -0.05) & (compound < 0.05)).astype(int)
+    })
+    for column in SENTIMENT_SUMS:
+        classes[column] = scores[column]
+    for user, sums in classes.groupby('user', observed=True).sum().iterrows():
+        aggregates['sentiment'][user] = Counter({key: float(value) for key, value in sums.items()})
+
+    # Day, weekday and hour keys come from the vectorized calendar features;
+    # days become datetime.date only once per (user, day) group
+    calendar = preprocessor.calendar_features(df['date'])
+    days = df.groupby([df['user'], calendar['only_date']], observed=True).size()
+    aggregates['daily'].update({(user, day.date()): count for (user, day), count in days.items()})
+    weekday = calendar['day_name'].codes.astype('int64')
+    slots = df.groupby([df['user'], weekday, calendar['hour'].astype('int64')], observed=True).size()
+    aggregates['weekly'].update(slots.to_dict())
+
+    aggregates['first_date'] = df['date'].min()
+    aggregates['last_date'] = df['date'].max()
+
+    return aggregates
+
+
+def merge(total, part):
+    """
+    Fold the aggregates of new messages into total, in place
+    """
+    for key in ['messages', 'words', 'media', 'links', 'daily', 'weekly']:
+        total[key].update(part[key])
+
+    for key in ['word_counts', 'emojis', 'sentiment']:
+        for user, counts in part[key].items():
+            total[key].setdefault(user, Counter()).update(counts)
+
+    if total['first_date'] is None:
+        total['first_date'] = part['first_date']
+    if part['last_date'] is not None:
+        total['last_date'] = part['last_date']
+
+    return total
+
+
+def _store_path(key, store_dir):
+    return os.path.join(store_dir, f"{key}-v{AGGREGATE_VERSION}-s{preprocessor.SCHEMA_VERSION}.pkl")
+
+
+def _load(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def _save(snapshot, path):
+    # Write to a temporary file first so readers never see a partial snapshot
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def _format_key(header_format):
+    # Picklable part of a detected header format
+    return {key: value for key, value in header_format.items() if key != 'pattern'}
+
+
+def find_tail(bytes_data, snapshot, header_format):
+    """
+    Offset where the messages new since the snapshot start, or None when
+    the export does not extend the one the snapshot was taken from. The
+    stored prefix must match byte for byte and have been parsed with the
+    same, fully detected header format, the tail must start with a message
+    header, and its first timestamp must not precede the last stored one.
+    """
+    if header_format['day_first'] is None or snapshot.get('header_format') != _format_key(header_format):
+        return None
+
+    prefix_length = snapshot['prefix_length']
+    if len(bytes_data) < prefix_length:
+        return None
+    if hashlib.sha256(bytes_data[:prefix_length]).hexdigest() != snapshot['prefix_hash']:
+        return None
+    if len(bytes_data) == prefix_length:
+        return prefix_length
+
+    # Headers are ASCII, so a short slice decodes safely even if it cuts a character
+    head = bytes_data[prefix_length:prefix_length + 64].decode('utf-8', errors='ignore')
+    match = header_format['pattern'].match(head)
+    if match is None:
+        return None
+
+    last_date = snapshot['aggregates']['last_date']
+    first_date = preprocessor.preprocess(match.group(), header_format=header_format)['date']
+    if last_date is not None and len(first_date) and first_date.iloc[0] < last_date:
+        return None
+
+    return prefix_length
+
+
+@instrumentation.instrument
+def ingest(bytes_data, store_dir=STORE_DIR):
+    """
+    Aggregates of an export, parsing only the messages added since the last
+    stored export of the same chat. Returns the aggregates and how they were
+    obtained: 'full', 'incremental' or 'unchanged', with the messages parsed.
+    """
+    path = _store_path(chat_id(bytes_data), store_dir)
+    snapshot = _load(path)
+
+    # Re-exports share their first bytes, so the tail is parsed with the
+    # format detected from the start of the whole export, or from all of it
+    # when the start leaves the day order open
+    sample = bytes_data[:preprocessor.FORMAT_SAMPLE_CHARS].decode('utf-8', errors='ignore')
+    header_format = preprocessor.detect_format(sample)
+    if header_format['day_first'] is None:
+        header_format = preprocessor.detect_format(bytes_data.decode('utf-8'), header_format)
+
+    offset = find_tail(bytes_data, snapshot, header_format) if snapshot is not None else None
+    if offset is None:
+        aggregates = aggregate(preprocessor.preprocess(bytes_data.decode('utf-8'), header_format=header_format))
+        mode = 'full'
+        parsed = sum(aggregates['messages'].values())
+    elif offset == len(bytes_data):
+        return snapshot['aggregates'], {'mode': 'unchanged', 'parsed_messages': 0}
+    else:
+        tail = aggregate(preprocessor.preprocess(bytes_data[offset:].decode('utf-8'), header_format=header_format))
+        aggregates = merge(snapshot['aggregates'], tail)
+        mode = 'incremental'
+        parsed = sum(tail['messages'].values())
+
+    _save({
+        'prefix_length': len(bytes_data),
+        'prefix_hash': hashlib.sha256(bytes_data).hexdigest(),
+        'header_format': _format_key(header_format),
+        'aggregates': aggregates
+    }, path)
+
+    return aggregates, {'mode': mode, 'parsed_messages': parsed}
+
+
+# Views over the aggregates, returning what the helper.py function of the
+# same name returns for a parsed frame
+
+def _users(aggregates, selected_user):
+    if selected_user == 'Overall':
+        return list(aggregates['messages'])
+    return [selected_user]
+
+
+def _sum(counter, users):
+    return sum(counter.get(user, 0) for user in users)
+
+
+def _combined(per_user, users):
+    total = Counter()
+    for user in users:
+        total.update(per_user.get(user, Counter()))
+    return total
+
+
+def fetch_stats(selected_user, aggregates):
+    users = _users(aggregates, selected_user)
+    return (_sum(aggregates['messages'], users), _sum(aggregates['words'], users),
+            _sum(aggregates['media'], users), _sum(aggregates['links'], users))
+
+
+def user_activity(selected_user, aggregates):
+    """
+    Daily counts over a contiguous calendar and weekday x hour counts of one
+    user, or of everyone for 'Overall', like helper.user_activity()
+    """
+    users = set(_users(aggregates, selected_user))
+    days = Counter()
+    for (user, day), count in aggregates['daily'].items():
+        if user in users:
+            days[day] += count
+
+    weekly = np.zeros((7, 24), dtype='int64')
+    for (user, weekday, hour), count in aggregates['weekly'].items():
+        if user in users:
+            weekly[weekday, hour] += count
+
+    if not days:
+        return np.zeros(0, dtype='int64'), weekly, pd.DatetimeIndex([])
+
+    calendar = pd.date_range(min(days), max(days), freq='D')
+    daily = np.array([days.get(day.date(), 0) for day in calendar], dtype='int64')
+
+    return daily, weekly, calendar
+
+
+def monthly_timeline(selected_user, aggregates):
+    daily, weekly, calendar = user_activity(selected_user, aggregates)
+    return helper.monthly_view(daily, calendar)
+
+
+def daily_timeline(selected_user, aggregates):
+    daily, weekly, calendar = user_activity(selected_user, aggregates)
+    return helper.daily_view(daily, calendar)
+
+
+def week_activity_map(selected_user, aggregates):
+    daily, weekly, calendar = user_activity(selected_user, aggregates)
+    return helper.weekday_view(weekly)
+
+
+def month_activity_map(selected_user, aggregates):
+    daily, weekly, calendar = user_activity(selected_user, aggregates)
+    return helper.month_name_view(daily, calendar)
+
+
+def activity_heatmap(selected_user, aggregates):
+    daily, weekly, calendar = user_activity(selected_user, aggregates)
+    return helper.heatmap_view(weekly)
+
+
+def most_common_words(selected_user, aggregates):
+    return pd.DataFrame(_combined(aggregates['word_counts'], _users(aggregates, selected_user)).most_common(20))
+
+
+def emoji_helper(selected_user, aggregates):
+    emojis = _combined(aggregates['emojis'], _users(aggregates, selected_user))
+    return pd.DataFrame(emojis.most_common(len(emojis)))
+
+
+def sentiment_analysis(selected_user, aggregates):
+    sums = _combined(aggregates['sentiment'], _users(aggregates, selected_user))
+    count = sums['count']
+    if not count:
+        return {
+            'positive': 0, 'negative': 0, 'neutral': 100,
+            'avg_positive': 0, 'avg_negative': 0, 'avg_neutral': 1, 'avg_sentiment': 0
+        }
+
+    return {
+        'positive': sums['positive'] / count * 100,
+        'negative': sums['negative'] / count * 100,
+        'neutral': sums['neutral'] / count * 100,
+        'avg_positive': sums['pos'] / count,
+        'avg_negative': sums['neg'] / count,
+        'avg_neutral': sums['neu'] / count,
+        'avg_sentiment': sums['compound'] / count
+    }
+
+
+def sentiment_by_user(aggregates):
+    rows = {user: {
+        'avg_sentiment': sums['compound'] / sums['count'],
+        'message_count': float(sums['count']),
+        'positive_messages': float(sums['positive']),
+        'negative_messages': float(sums['negative']),
+        'neutral_messages': float(sums['neutral'])
+    } for user, sums in aggregates['sentiment'].items() if sums['count']}
+
+    if not rows:
+        return pd.DataFrame()
+
+    return pd.DataFrame(rows).T.sort_values('avg_sentiment', ascending=False)
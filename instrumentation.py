@@ -0,0 +1,138 @@
+# Opt-in per-stage timing and memory records for the parser, helpers and charts
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+# Log a structured line for every instrumented stage in this process
+ENABLED = os.environ.get('WA_PROFILE', '0') != '0'
+
+# Logger the structured records are written to, one JSON object per line.
+# Unless the embedding process configured it, records go to stderr.
+logger = logging.getLogger('whatsapp_analyzer.profile')
+if ENABLED and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+# List collecting records for the current recording() block, if any
+_records = contextvars.ContextVar('whatsapp_analyzer_profile_records', default=None)
+
+# Returned by stage() when nothing is recorded, so a disabled stage costs one check
+_NULL_STAGE = contextlib.nullcontext()
+
+
+def rss_bytes():
+    # Current resident set size, or the process peak where /proc is missing
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def active():
+    # Whether stages run now are logged or collected
+    return ENABLED or _records.get() is not None
+
+
+def row_count(value):
+    # Row count of a DataFrame, Series, array or list, None for anything else
+    shape = getattr(value, 'shape', None)
+    if shape:
+        return int(shape[0])
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    return None
+
+
+@contextlib.contextmanager
+def _timed(name, rows, **fields):
+    info = {'rows': rows, **fields}
+    start_rss = rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        record = {
+            'stage': name,
+            'seconds': round(time.perf_counter() - start, 6),
+            'rss_delta_mb': round((rss_bytes() - start_rss) / 1024 ** 2, 2),
+            'thread': threading.current_thread().name
+        }
+        record.update(info)
+
+        records = _records.get()
+        if records is not None:
+            records.append(record)
+        if ENABLED:
+            logger.info(json.dumps(record, default=str))
+
+
+def stage(name, rows=None, **fields):
+    """
+    Context manager timing a block as its own stage. Extra keyword fields
+    (e.g. bytes=...) are stored in the record as they are.
+    """
+    if not active():
+        return _NULL_STAGE
+    return _timed(name, rows, **fields)
+
+
+def instrument(func):
+    """
+    Decorator recording wall time, input and output rows and the change in
+    resident memory of every call. The memory delta is process-wide, so it
+    includes whatever other threads allocated meanwhile.
+    """
+    name = f"{func.__module__}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not (ENABLED or _records.get() is not None):
+            return func(*args, **kwargs)
+
+        rows = next((count for count in map(row_count, args) if count is not None), None)
+        with _timed(name, rows) as info:
+            result = func(*args, **kwargs)
+            info['rows_out'] = row_count(result)
+        return result
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def recording():
+    """
+    Collect the records of every stage run inside the block, including on
+    threads started with a copy of the current context, into the yielded list
+    """
+    records = []
+    token = _records.set(records)
+    try:
+        yield records
+    finally:
+        _records.reset(token)
+
+
+def summarize(records):
+    """
+    Total time, calls and largest memory delta per stage, slowest first
+    """
+    stages = {}
+    for record in records:
+        total = stages.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0, 'seconds': 0.0,
+                                                    'max_rss_delta_mb': 0.0})
+        total['calls'] += 1
+        total['seconds'] = round(total['seconds'] + record['seconds'], 6)
+        total['max_rss_delta_mb'] = max(total['max_rss_delta_mb'], record['rss_delta_mb'])
+
+    return sorted(stages.values(), key=lambda total: total['seconds'], reverse=True)
@@ -0,0 +1,82 @@
+# Sharded execution of per-message passes over a process pool
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Number of worker processes, 1 disables the pool entirely
+WORKERS = int(os.environ.get('WA_WORKERS', os.cpu_count() or 1))
+
+# Chats with fewer items than this run in the calling process, so small
+# files don't pay the process startup and pickling cost
+SERIAL_THRESHOLD = int(os.environ.get('WA_SERIAL_THRESHOLD', 50000))
+
+# Shards created per worker, more shards balance uneven message lengths
+SHARDS_PER_WORKER = 4
+
+# Workers start from a fresh interpreter instead of forking the (possibly
+# threaded) parent, which can copy locks held by other threads
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Modules the forkserver imports once, so workers fork with the text passes
+# and the chart layer already loaded instead of importing them on first use
+PRELOAD = ['helper', 'charts']
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers):
+    # Reuse one pool per process so workers stay warm; threads share it
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            # Work already queued on a replaced pool still runs to completion
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            context = multiprocessing.get_context(START_METHOD)
+            if START_METHOD == 'forkserver':
+                context.set_forkserver_preload(PRELOAD)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+atexit.register(shutdown)
+
+
+def run_sharded(func, items, merge, workers=None):
+    """
+    Run func over shards of items and combine the partial results with merge.
+    func must be a picklable top-level function taking a list of items, and
+    merge receives the list of partial results in shard order.
+    """
+    items = list(items)
+    workers = workers or WORKERS
+
+    if workers <= 1 or len(items) < SERIAL_THRESHOLD:
+        return merge([func(items)])
+
+    shard_count = workers * SHARDS_PER_WORKER
+    shard_size = -(-len(items) // shard_count)
+    shards = [items[i:i + shard_size] for i in range(0, len(items), shard_size)]
+
+    return merge(list(get_pool(workers).map(func, shards)))
+
+
+def merge_lists(lists):
+    # Concatenate per-shard lists, keeping the original item order
+    merged = []
+    for part in lists:
+        merged.extend(part)
+    return merged
@@ -1,38 +1,241 @@
 import re
+import codecs
+from collections import Counter
+from functools import lru_cache
+import numpy as np
 import pandas as pd
+import instrumentation
 
-def preprocess(data):
-    # Define the pattern to extract date and time from messages
-    pattern = '\d{1,2}/\d{1,2}/\d{2}, \d{1,2}:\d{2}\s?(?:AM|PM)\s?-\s?'
+# Message header layouts of the exports WhatsApp writes. Android puts
+# "date, time - " at the start of each message line, iOS "[date, time] ",
+# the first one possibly after the byte order mark some exports begin with.
+# Either way the date can be day or month first with 2 or 4 digit years and
+# the time can be 12h (AM/PM, possibly after a narrow no-break space) or 24h
+# with or without seconds. These loose patterns only serve to detect which
+# of those an export uses; named groups let the headers be parsed in bulk.
+_DATE = r'(?P<first>\d{1,2})(?P<date_sep>[/.-])(?P<second>\d{1,2})(?P=date_sep)(?P<year>\d{4}|\d{2}),?\s'
+_TIME = (r'(?P<hour>\d{1,2})(?P<time_sep>[:.])(?P<minute>\d{2})(?:(?P=time_sep)(?P<seconds>\d{2}))?'
+         r'(?:[\s\u202f]?(?P<ampm>[AaPp]\.?\s?[Mm]\.?))?')
+_LAYOUTS = {
+    'android': (r'(?m)^\ufeff?', r'\s?-\s?'),
+    'ios': (r'(?m)^\ufeff?\u200e?\[', r'\]\s')
+}
+HEADER_PATTERNS = {name: re.compile(prefix + _DATE + _TIME + suffix) for name, (prefix, suffix) in _LAYOUTS.items()}
 
-    # Split the data using the pattern to get messages
-    messages = re.split(pattern, data)[1:]
+# Layout of the default (Android, US 12-hour) export
+DEFAULT_FORMAT = {'name': 'android', 'date_sep': '/', 'time_sep': ':', 'clock': '12h', 'seconds': False}
 
-    # Find all the dates using the pattern
-    dates = re.findall(pattern, data)
+
+@lru_cache(maxsize=None)
+def header_pattern(name, date_sep, time_sep, clock, seconds):
+    """
+    Pattern matching only the headers of one detected layout: its platform,
+    date and time separators, 12h or 24h clock and whether times have
+    seconds. Dates quoted inside a message never start a line in that exact
+    form, so they are left in the message body.
+    """
+    prefix, suffix = _LAYOUTS[name]
+    date_sep, time_sep = re.escape(date_sep), re.escape(time_sep)
+    pattern = (prefix + rf'(?P<first>\d{{1,2}}){date_sep}(?P<second>\d{{1,2}}){date_sep}(?P<year>\d{{4}}|\d{{2}}),?\s'
+               + rf'(?P<hour>\d{{1,2}}){time_sep}(?P<minute>\d{{2}})')
+    if seconds:
+        pattern += rf'{time_sep}(?P<seconds>\d{{2}})'
+    if clock == '12h':
+        pattern += r'[\s\u202f]?(?P<ampm>[AaPp]\.?\s?[Mm]\.?)'
+
+    return re.compile(pattern + suffix)
+
+
+# Pattern of the default layout
+HEADER_PATTERN = header_pattern(**DEFAULT_FORMAT)
+
+# Characters sampled from the start of an export to detect its header format
+FORMAT_SAMPLE_CHARS = 64 * 1024
+
+# Pattern to match user_name followed by ': '
+USER_PATTERN = re.compile(r'^([\w\s]+?):\s(.*)$')
+
+# Bump whenever the columns or dtypes returned by preprocess() change, so
+# frames persisted by chat_cache are invalidated
+SCHEMA_VERSION = 2
+
+# Columns derived from `date` by add_calendar()
+CALENDAR_COLUMNS = ['year', 'day_name', 'only_date', 'month_num', 'month', 'day', 'hour', 'minute', 'period']
+
+# Columns of the frame preprocess() returns
+FRAME_COLUMNS = ['date', 'user', 'message'] + CALENDAR_COLUMNS
+
+# Fixed category orders for the calendar name columns
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+PERIODS = ['00-1'] + [f"{hour}-{hour + 1}" for hour in range(1, 23)] + ['23-00']
+
+# Default number of bytes read per chunk by the streaming parser
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+@instrumentation.instrument
+def preprocess(data, lazy_calendar=False, header_format=None):
+    # Detect the header layout from the start of the export unless given
+    if header_format is None:
+        header_format = detect_format(data[:FORMAT_SAMPLE_CHARS])
+
+    # Split the data into header strings and messages in one pass
+    dates, messages = tokenize(data, header_format)
+
+    return build_frame(dates, messages, lazy_calendar=lazy_calendar, header_format=header_format)
+
+
+def _day_first(first, second):
+    # A number above 12 can only be a day; None while every date reads both ways
+    if (first > 12).any():
+        return True
+    if (second > 12).any():
+        return False
+    return None
+
+
+def _settle_day_first(first, second, year):
+    # Day order of headers in file order: a number above 12, else the order
+    # keeping them chronological, else month first as in the US layout
+    day_first = _day_first(first, second)
+    if day_first is None:
+        breaks = [(np.diff(year * 10000 + month * 100 + day) < 0).sum()
+                  for month, day in [(first, second), (second, first)]]
+        day_first = bool(breaks[1] < breaks[0])
+    return day_first
+
+
+def _most_common(values, default):
+    # Value of most of the sampled headers, the default when there are none
+    return Counter(values).most_common(1)[0][0] if values else default
+
+
+def detect_format(sample, header_format=None):
+    """
+    Detect the header layout of an export from a sample of its text: the
+    platform whose pattern matches most headers, the separators, clock and
+    seconds most of them use, and whether dates are day first. day_first is
+    None when no date in the sample has a day above 12; parse_dates() then
+    settles it from all the headers it parses. With a header_format, only
+    its day order is detected from the sample.
+    """
+    if header_format is None:
+        name, matches = max(((name, list(pattern.finditer(sample))) for name, pattern in HEADER_PATTERNS.items()),
+                            key=lambda item: len(item[1]))
+        if not matches:
+            name = DEFAULT_FORMAT['name']
+
+        header_format = {
+            'name': name,
+            'date_sep': _most_common([match['date_sep'] for match in matches], DEFAULT_FORMAT['date_sep']),
+            'time_sep': _most_common([match['time_sep'] for match in matches], DEFAULT_FORMAT['time_sep']),
+            'clock': _most_common(['12h' if match['ampm'] else '24h' for match in matches], DEFAULT_FORMAT['clock']),
+            'seconds': _most_common([match['seconds'] is not None for match in matches], DEFAULT_FORMAT['seconds'])
+        }
+        header_format['pattern'] = header_pattern(**header_format)
+
+    # Only headers in the detected layout decide the day order
+    matches = list(header_format['pattern'].finditer(sample))
+    first = np.array([int(match['first']) for match in matches], dtype=np.int64)
+    second = np.array([int(match['second']) for match in matches], dtype=np.int64)
+
+    return dict(header_format, day_first=_day_first(first, second))
+
+
+@instrumentation.instrument
+def tokenize(data, header_format=None):
+    """
+    Single pass over the export returning the header strings and the message
+    body that follows each of them. Text before the first header is dropped.
+    """
+    pattern = (header_format or detect_format(data[:FORMAT_SAMPLE_CHARS]))['pattern']
+    dates = []
+    spans = []
+    for match in pattern.finditer(data):
+        dates.append(match.group())
+        spans.append(match.span())
+
+    # Each message runs from the end of its header to the start of the next one
+    ends = [start for start, _ in spans[1:]] + [len(data)]
+    messages = [data[end_of_header:end] for (_, end_of_header), end in zip(spans, ends)]
+
+    return dates, messages
+
+
+def _header_fields(match):
+    # Numbers of one header, with 0 for no AM/PM marker, 1 for AM and 2 for PM
+    fields = match.groupdict('0')
+    meridiem = fields.get('ampm', '0')
+    return (int(fields['first']), int(fields['second']), int(fields['year']), int(fields['hour']),
+            int(fields['minute']), int(fields.get('seconds', '0')),
+            0 if meridiem == '0' else 2 if meridiem[0] in 'pP' else 1)
+
+
+@instrumentation.instrument
+def parse_dates(dates, header_format):
+    """
+    Timestamps of header strings. Busy chats repeat the same minute many
+    times, so each distinct header is parsed once and the results are
+    mapped back to every message.
+    """
+    codes, uniques = pd.factorize(pd.Series(dates, dtype=object))
+
+    # Split the distinct headers into their numeric parts
+    fields = np.array([_header_fields(header_format['pattern'].match(header)) for header in uniques],
+                      dtype=np.int64).reshape(-1, 7)
+    first, second, year, hour, minute, seconds, meridiem = fields.T
+
+    # Two digit years are 20xx, 12-hour clocks count 12 AM as midnight
+    year = np.where(year < 100, year + 2000, year)
+    hour = np.where(meridiem == 0, hour, hour % 12 + 12 * (meridiem == 2))
+
+    # An undetected day order is settled by these headers (uniques are in file order)
+    day_first = header_format['day_first']
+    if day_first is None:
+        day_first = _settle_day_first(first, second, year)
+    day, month = (first, second) if day_first else (second, first)
+
+    # Assemble the timestamps with datetime arithmetic, rejecting days a
+    # month does not have and out of range times instead of letting them roll over
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + (day - 1).astype('timedelta64[D]')
+    invalid = ((month < 1) | (month > 12) | (day < 1) | (days.astype('datetime64[M]') != months)
+               | (hour > 23) | (minute > 59) | (seconds > 59))
+    if invalid.any():
+        raise ValueError(f"invalid date in message header {uniques[invalid.argmax()]!r}")
+    stamps = days.astype('datetime64[us]') + ((hour * 60 + minute) * 60 + seconds).astype('timedelta64[s]')
+
+    return stamps[codes]
+
+
+@instrumentation.instrument
+def build_frame(dates, messages, start=0, lazy_calendar=False, header_format=None):
+    """
+    Build the analysis DataFrame from raw header strings and message bodies.
+    `start` offsets the index so that streamed batches line up with preprocess()
+    """
+    if header_format is None:
+        header_format = detect_format('\n'.join(dates[:1000]))
 
     # Create a DataFrame with messages and dates
-    df = pd.DataFrame({'user_message': messages, 'message_date': dates})
+    df = pd.DataFrame({'user_message': messages, 'message_date': dates},
+                      index=pd.RangeIndex(start, start + len(messages)), dtype=object)
 
     # Convert message_date to datetime format
-    df['message_date'] = pd.to_datetime(df['message_date'], format='%m/%d/%y, %I:%M %p - ')
+    with instrumentation.stage('preprocessor.to_datetime', len(df)):
+        df['message_date'] = parse_dates(dates, header_format)
 
     # Rename message_date column to date
     df.rename(columns={'message_date': 'date'}, inplace=True)
 
-    # Function to split user_message into user_name and message
-    def split_user_message(message):
-        # Pattern to match user_name followed by ': '
-        pattern = '^([\w\s]+?):\s(.*)$'
-        match = re.match(pattern, message)
-
-        if match:
-            return match.group(1), match.group(2)
-        else:
-            return 'group_notification', message
-
-    # Apply the function to split user_message into user_name and message
-    df[['user_name', 'message']] = df['user_message'].apply(lambda x: pd.Series(split_user_message(x)))
+    # Split user_message into user_name and message, lines without a sender
+    # are group notifications and keep their full text
+    with instrumentation.stage('preprocessor.split_users', len(df)):
+        extracted = df['user_message'].str.extract(USER_PATTERN)
+        df['user_name'] = extracted[0].fillna('group_notification').astype('category')
+        df['message'] = extracted[1].fillna(df['user_message'])
 
     # Drop the original user_message column
     df.drop(columns=['user_message'], inplace=True)
@@ -40,26 +243,145 @@ def preprocess(data):
     # Rename user_name column to user
     df.rename(columns={'user_name': 'user'}, inplace=True)
 
-    # Extract year, month, day, etc. from the date
-    df['year'] = df['date'].dt.year
-    df['day_name'] = df['date'].dt.day_name()
-    df['only_date'] = df['date'].dt.date
-    df['month_num'] = df['date'].dt.month
-    df['month'] = df['date'].dt.month_name()
-    df['day'] = df['date'].dt.day
-    df['hour'] = df['date'].dt.hour
-    df['minute'] = df['date'].dt.minute
-
-    # Create a period column for time intervals
-    period = []
-    for hour in df[['day_name', 'hour']]['hour']:
-        if hour == 23:
-            period.append(str(hour) + "-" + str('00'))
-        elif hour == 0:
-            period.append(str('00') + "-" + str(hour + 1))
-        else:
-            period.append(str(hour) + "-" + str(hour + 1))
-
-    df['period'] = period
+    # Calendar columns can be derived later with add_calendar()
+    if not lazy_calendar:
+        add_calendar(df)
+
+    return df
+
+
+def calendar_features(dates):
+    """
+    Calendar columns of a datetime Series or array, keyed by column name.
+    Every field comes from integer arithmetic on the datetime64 values, and
+    the name columns are categoricals built from codes, with PERIODS as the
+    hour -> period lookup table, so no per-row string is ever created.
+    """
+    values = np.asarray(dates, dtype='datetime64[us]')
+    days = values.astype('datetime64[D]')
+    months = values.astype('datetime64[M]')
+    minutes = (values - days).astype('timedelta64[m]').astype(np.int64)
+    month_index = months.astype(np.int64) % 12
+    hour = (minutes // 60).astype(np.int8)
+
+    # 1970-01-01 was a Thursday, so shift day numbers to count from Monday
+    weekday = (days.astype(np.int64) + 3) % 7
+
+    return {
+        'year': (values.astype('datetime64[Y]').astype(np.int64) + 1970).astype(np.int16),
+        'day_name': pd.Categorical.from_codes(weekday, categories=DAY_NAMES),
+        'only_date': days.astype('datetime64[us]'),
+        'month_num': (month_index + 1).astype(np.int8),
+        'month': pd.Categorical.from_codes(month_index, categories=MONTH_NAMES),
+        'day': ((days - months.astype('datetime64[D]')).astype(np.int64) + 1).astype(np.int8),
+        'hour': hour,
+        'minute': (minutes % 60).astype(np.int8),
+        'period': pd.Categorical.from_codes(hour, categories=PERIODS)
+    }
+
+
+@instrumentation.instrument
+def add_calendar(df):
+    """
+    Derive the calendar columns (year, month, day, hour, period, ...) from
+    `date` in place. Low-cardinality names are categoricals with a fixed
+    order and numbers use the smallest integer type that fits.
+    """
+    if set(CALENDAR_COLUMNS).issubset(df.columns):
+        return df
+
+    for column, values in calendar_features(df['date']).items():
+        df[column] = values
+
+    return df
+
+
+def _read_chunks(source, chunk_size):
+    # Accept a path, a binary stream or a text stream and yield decoded text
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            yield from _read_chunks(f, chunk_size)
+        return
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        yield chunk
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _stream_format(sample, header_format):
+    """
+    Header format of a stream, detected from its first sample alone. A day
+    order the sample leaves open is settled from the sample's headers as
+    parse_dates() would, so the rest of the stream is never held back.
+    """
+    header_format = detect_format(sample, header_format)
+    if header_format['day_first'] is None:
+        fields = np.array([_header_fields(match) for match in header_format['pattern'].finditer(sample)],
+                          dtype=np.int64).reshape(-1, 7)
+        first, second, year = fields.T[:3]
+        header_format['day_first'] = _settle_day_first(first, second, np.where(year < 100, year + 2000, year))
+    return header_format
+
+
+def preprocess_stream(source, chunk_size=DEFAULT_CHUNK_SIZE, lazy_calendar=False, header_format=None):
+    """
+    Parse an export in bounded chunks and yield DataFrame batches.
+    `source` can be a file path or a binary/text file object. The last header
+    seen in each chunk is held back, so multi-line messages and headers cut by
+    a chunk boundary are completed by the next read. The header layout and
+    day order are detected once, from the first FORMAT_SAMPLE_CHARS of the
+    stream, and used for every batch.
+    """
+    pending = ''
+    start = 0
+
+    for chunk in _read_chunks(source, chunk_size):
+        pending += chunk
+
+        # Hold text back only until the sample the format is detected from is read
+        if header_format is None or header_format['day_first'] is None:
+            if len(pending) < FORMAT_SAMPLE_CHARS:
+                continue
+            header_format = _stream_format(pending[:FORMAT_SAMPLE_CHARS], header_format)
+
+        dates, messages = tokenize(pending, header_format)
+        if len(dates) < 2:
+            continue
+
+        # Every header except the last one is followed by a complete message
+        pending = pending[len(pending) - len(dates[-1]) - len(messages[-1]):]
+        dates, messages = dates[:-1], messages[:-1]
+
+        yield build_frame(dates, messages, start, lazy_calendar, header_format)
+        start += len(messages)
+
+    # Flush whatever is left once the stream is exhausted
+    if header_format is None:
+        header_format = detect_format(pending[:FORMAT_SAMPLE_CHARS])
+    dates, messages = tokenize(pending, header_format)
+    if dates:
+        yield build_frame(dates, messages, start, lazy_calendar, header_format)
+
+
+@instrumentation.instrument
+def preprocess_file(source, chunk_size=DEFAULT_CHUNK_SIZE, lazy_calendar=False, header_format=None):
+    """
+    Streaming counterpart of preprocess() returning a single DataFrame
+    """
+    batches = list(preprocess_stream(source, chunk_size, lazy_calendar, header_format))
+    if not batches:
+        return preprocess('', lazy_calendar, header_format)
+
+    # Batches carry different user categories, so re-encode after joining
+    df = pd.concat(batches)
+    df['user'] = df['user'].astype('category')
 
     return df
@@ -0,0 +1,129 @@
+# Deterministic generator of synthetic WhatsApp exports for benchmarks
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta
+
+# Words messages are built from: everyday chat, Hinglish and words that
+# carry VADER sentiment, so every helper has something to count and score
+VOCABULARY = ['ok', 'yes', 'no', 'haha', 'lol', 'hello', 'there', 'what', 'when', 'where', 'today', 'tomorrow',
+              'tonight', 'meeting', 'office', 'home', 'food', 'movie', 'call', 'me', 'later', 'now', 'see', 'you',
+              'the', 'a', 'is', 'it', 'this', 'that', 'we', 'they', 'will', 'be', 'there', 'at', 'on',
+              'kya', 'hai', 'kal', 'aaj', 'bhai', 'yaar', 'acha', 'theek', 'nahi', 'haan', 'chalo', 'kaha',
+              'love', 'great', 'good', 'happy', 'awesome', 'thanks', 'nice', 'best', 'fun', 'beautiful',
+              'bad', 'sad', 'hate', 'terrible', 'angry', 'worst', 'sorry', 'tired', 'boring', 'awful',
+              'not', "don't", 'very', 'really', 'so', 'extremely', 'but']
+
+# Single code points, skin tones, ZWJ sequences, flags and keycaps
+EMOJIS = ['😂', '❤️', '👍', '🙏', '😊', '😭', '🔥', '😍', '👍🏽', '🙋🏻‍♀️', '👨‍👩‍👧', '🇮🇳', '🇺🇸',
+          '1️⃣', '🎉', '😢', '😡', '🤔']
+
+URLS = ['https://example.com/article', 'http://news.example.org/a/b?c=1', 'www.google.com',
+        'https://youtu.be/dQw4w9WgXcQ', 'github.com/user/repo']
+
+NOTIFICATIONS = ['{user} added {other}', '{user} left', '{user} changed the subject to "plans"',
+                 '{user} changed this group\'s icon']
+
+DEFAULT_USERS = ['Alice', 'Bob Smith', 'Chetan', 'Dee', 'Esha Patel', 'Farhan']
+
+
+def header(timestamp):
+    # Header in the %m/%d/%y, %I:%M %p format without zero padding, as exported
+    hour = timestamp.hour % 12 or 12
+    meridiem = 'AM' if timestamp.hour < 12 else 'PM'
+    return f"{timestamp.month}/{timestamp.day}/{timestamp:%y}, {hour}:{timestamp:%M} {meridiem} - "
+
+
+# Header layouts an export can be written in: US Android (the default),
+# day-first 24-hour Android and day-first iOS with seconds
+HEADERS = {
+    'android-us': header,
+    'android-24h': lambda timestamp: f"{timestamp:%d/%m/%Y, %H:%M} - ",
+    'ios': lambda timestamp: f"[{timestamp:%d/%m/%y, %H:%M:%S}] "
+}
+
+
+def generate(messages, users=None, seed=0, min_words=1, max_words=20, emoji_rate=0.15, url_rate=0.03,
+             media_rate=0.05, multiline_rate=0.03, notification_rate=0.01, start=datetime(2020, 1, 1),
+             mean_gap_minutes=30, layout='android-us'):
+    """
+    Yield the lines of a synthetic export, one message per item. The same
+    arguments always produce the same export. Rates are per-message
+    probabilities; message lengths are uniform between min_words and
+    max_words. `layout` is one of HEADERS.
+    """
+    header = HEADERS[layout]
+    rng = random.Random(seed)
+    users = users or DEFAULT_USERS
+    timestamp = start
+
+    yield f"{header(timestamp)}Messages and calls are end-to-end encrypted.\n"
+
+    for _ in range(messages):
+        timestamp += timedelta(minutes=int(rng.expovariate(1 / mean_gap_minutes)))
+        user = rng.choice(users)
+
+        if rng.random() < notification_rate:
+            text = rng.choice(NOTIFICATIONS).format(user=user, other=rng.choice(users))
+            yield f"{header(timestamp)}{text}\n"
+            continue
+
+        if rng.random() < media_rate:
+            yield f"{header(timestamp)}{user}: <Media omitted>\n"
+            continue
+
+        words = rng.choices(VOCABULARY, k=rng.randint(min_words, max_words))
+        if rng.random() < url_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(URLS))
+        if rng.random() < emoji_rate:
+            words.append(''.join(rng.choices(EMOJIS, k=rng.randint(1, 3))))
+        if rng.random() < multiline_rate and len(words) > 1:
+            cut = rng.randrange(1, len(words))
+            words[cut] = '\n' + words[cut]
+
+        yield f"{header(timestamp)}{user}: {' '.join(words)}\n"
+
+
+def write_export(path, messages, **options):
+    # Stream a synthetic export to disk without holding it in memory
+    with open(path, 'w', encoding='utf-8') as f:
+        batch = []
+        for line in generate(messages, **options):
+            batch.append(line)
+            if len(batch) >= 10000:
+                f.write(''.join(batch))
+                batch = []
+        f.write(''.join(batch))
+
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic WhatsApp export.")
+    parser.add_argument('output', help="path of the .txt export to write, '-' for stdout")
+    parser.add_argument('-n', '--messages', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--users', type=int, default=len(DEFAULT_USERS), help="number of participants")
+    parser.add_argument('--min-words', type=int, default=1)
+    parser.add_argument('--max-words', type=int, default=20)
+    parser.add_argument('--emoji-rate', type=float, default=0.15)
+    parser.add_argument('--url-rate', type=float, default=0.03)
+    parser.add_argument('--media-rate', type=float, default=0.05)
+    parser.add_argument('--multiline-rate', type=float, default=0.03)
+    parser.add_argument('--notification-rate', type=float, default=0.01)
+    parser.add_argument('--layout', choices=list(HEADERS), default='android-us', help="message header layout")
+    args = parser.parse_args(argv)
+
+    users = DEFAULT_USERS[:args.users] + [f"User {i}" for i in range(len(DEFAULT_USERS), args.users)]
+    options = dict(users=users, seed=args.seed, min_words=args.min_words, max_words=args.max_words,
+                   emoji_rate=args.emoji_rate, url_rate=args.url_rate, media_rate=args.media_rate,
+                   multiline_rate=args.multiline_rate, notification_rate=args.notification_rate, layout=args.layout)
+
+    if args.output == '-':
+        sys.stdout.writelines(generate(args.messages, **options))
+    else:
+        write_export(args.output, args.messages, **options)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# On-disk store of parsed chats
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+import chat_cache
+import preprocessor
+import synthetic_chat
+
+
+def entry(cache_dir, name, size, mtime):
+    path = os.path.join(cache_dir, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_concurrent_evictions_skip_removed_entries(tmp_path):
+    suffix = f"-v{preprocessor.SCHEMA_VERSION}.feather"
+    for i in range(1000):
+        entry(tmp_path, f"{i:04}{suffix}", 100, i + 1)
+
+    errors = []
+
+    def evict():
+        try:
+            chat_cache.evict(str(tmp_path), 1000)
+        except OSError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=evict) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(os.listdir(tmp_path)) == [f"{i:04}{suffix}" for i in range(990, 1000)]
+
+
+def test_evict_removes_stale_temporary_files(tmp_path):
+    stale = entry(tmp_path, 'stale.tmp', 10, 1)
+    fresh = entry(tmp_path, 'fresh.tmp', 10, os.path.getmtime(tmp_path))
+
+    chat_cache.evict(str(tmp_path))
+
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
+
+
+def test_repeat_load_returns_the_parsed_frame(tmp_path):
+    pytest.importorskip('pyarrow')
+    bytes_data = ''.join(synthetic_chat.generate(2000, seed=3, multiline_rate=0.2)).encode('utf-8')
+
+    parsed = chat_cache.load_chat(bytes_data, cache_dir=str(tmp_path))
+    cached = chat_cache.load_chat(bytes_data, cache_dir=str(tmp_path))
+
+    assert len(os.listdir(tmp_path)) == 1
+    pd.testing.assert_frame_equal(cached, parsed)
@@ -0,0 +1,153 @@
+# Parity of the single-pass parser with the original re.split/re.findall parser
+import io
+import re
+
+import pandas as pd
+import pytest
+
+import preprocessor
+import synthetic_chat
+
+BASELINE_PATTERN = r'\d{1,2}/\d{1,2}/\d{2}, \d{1,2}:\d{2}\s?(?:AM|PM)\s?-\s?'
+
+
+def baseline_preprocess(data):
+    # The parser as it was before the single-pass rewrite, kept as the reference
+    messages = re.split(BASELINE_PATTERN, data)[1:]
+    dates = re.findall(BASELINE_PATTERN, data)
+
+    df = pd.DataFrame({'user_message': messages, 'message_date': dates})
+    df['date'] = pd.to_datetime(df['message_date'], format='%m/%d/%y, %I:%M %p - ')
+
+    def split_user_message(message):
+        match = re.match(r'^([\w\s]+?):\s(.*)$', message)
+        if match:
+            return match.group(1), match.group(2)
+        return 'group_notification', message
+
+    split = [split_user_message(message) for message in df['user_message']]
+    df['user'] = [user for user, _ in split]
+    df['message'] = [message for _, message in split]
+
+    df['year'] = df['date'].dt.year
+    df['day_name'] = df['date'].dt.day_name()
+    df['only_date'] = df['date'].dt.date
+    df['month_num'] = df['date'].dt.month
+    df['month'] = df['date'].dt.month_name()
+    df['day'] = df['date'].dt.day
+    df['hour'] = df['date'].dt.hour
+    df['minute'] = df['date'].dt.minute
+    df['period'] = [f"{hour}-00" if hour == 23 else f"00-{hour + 1}" if hour == 0 else f"{hour}-{hour + 1}"
+                    for hour in df['hour']]
+
+    return df[['date', 'user', 'message'] + preprocessor.CALENDAR_COLUMNS]
+
+
+def normalize(df):
+    # Compare values, not the compact dtypes the new parser uses
+    df = df.reset_index(drop=True).copy()
+    df['date'] = pd.to_datetime(df['date']).astype('datetime64[us]')
+    df['only_date'] = pd.to_datetime(df['only_date']).astype('datetime64[us]')
+    for column in ['user', 'message', 'day_name', 'month', 'period']:
+        df[column] = df[column].astype(object)
+    for column in ['year', 'month_num', 'day', 'hour', 'minute']:
+        df[column] = df[column].astype('int64')
+    return df
+
+
+def export(messages, **options):
+    return ''.join(synthetic_chat.generate(messages, **options))
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'multiline_rate': 0.3},
+    {'notification_rate': 0.2, 'media_rate': 0.2},
+    {'mean_gap_minutes': 1, 'multiline_rate': 0.1, 'notification_rate': 0.1},
+])
+def test_preprocess_matches_baseline(options):
+    data = export(3000, seed=11, **options)
+
+    expected = normalize(baseline_preprocess(data))
+    actual = normalize(preprocessor.preprocess(data)[['date', 'user', 'message'] + preprocessor.CALENDAR_COLUMNS])
+
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_tokenize_matches_split_and_findall():
+    data = "dropped preamble\n" + export(2000, seed=5, multiline_rate=0.3, notification_rate=0.1)
+
+    dates, messages = preprocessor.tokenize(data)
+
+    assert dates == re.findall(BASELINE_PATTERN, data)
+    assert messages == re.split(BASELINE_PATTERN, data)[1:]
+
+
+def test_multiline_messages_and_notifications():
+    data = ("1/2/23, 9:05 AM - Alice: first line\nsecond line\n"
+            "1/2/23, 9:06 AM - Bob added Alice\n"
+            "1/2/23, 12:00 PM - Bob Smith: hi\n")
+
+    pd.testing.assert_frame_equal(normalize(preprocessor.preprocess(data)[baseline_preprocess(data).columns]),
+                                  normalize(baseline_preprocess(data)))
+
+
+def test_empty_export():
+    assert preprocessor.preprocess('').empty
+    assert preprocessor.preprocess('no headers at all').empty
+
+
+@pytest.mark.parametrize('data', ['\ufeff12/31/20, 9:05 PM - Ann: hi\n1/1/21, 9:00 AM - Bob: yo\n',
+                                  '\ufeff[31.12.20, 21:05:00] Ann: hi\n[01.01.21, 09:00:00] Bob: yo\n'])
+def test_export_starting_with_a_byte_order_mark(data):
+    df = preprocessor.preprocess(data)
+
+    assert df['user'].tolist() == ['Ann', 'Bob']
+    assert df['date'].iloc[0] == pd.Timestamp('2020-12-31 21:05')
+
+
+def test_dates_inside_messages_are_not_headers():
+    data = ("12/05/2023, 10:00 - Anna: Treffen am 13.05.2023 18:30 - bitte pünktlich\n"
+            "12/05/2023, 10:01 - Ben: ok\n"
+            "1/2/23, 4:56 - Cem: see 1.2.23 4.56 - ok and 1/3/23, 9:00 - too\n")
+
+    df = preprocessor.preprocess(data)
+
+    assert df['user'].tolist() == ['Anna', 'Ben', 'Cem']
+    assert df['message'].tolist() == ['Treffen am 13.05.2023 18:30 - bitte pünktlich', 'ok',
+                                      'see 1.2.23 4.56 - ok and 1/3/23, 9:00 - too']
+
+
+def test_detect_format_keeps_to_the_detected_layout():
+    data = ("[13.05.23, 10:00:01] Anna: hi\n"
+            "[14.05.23, 10:00:02] Ben: moved from\n"
+            "[1/2/23, 4:56 PM] Ben: another app\n")
+
+    header_format = preprocessor.detect_format(data)
+    dates, messages = preprocessor.tokenize(data, header_format)
+    df = preprocessor.preprocess(data)
+
+    assert {key: header_format[key] for key in ['name', 'date_sep', 'time_sep', 'clock', 'seconds', 'day_first']} == {
+        'name': 'ios', 'date_sep': '.', 'time_sep': ':', 'clock': '24h', 'seconds': True, 'day_first': True}
+    assert df['date'].tolist() == [pd.Timestamp('2023-05-13 10:00:01'), pd.Timestamp('2023-05-14 10:00:02')]
+    assert messages[-1] == 'Ben: moved from\n[1/2/23, 4:56 PM] Ben: another app\n'
+
+
+def test_stream_settles_an_open_day_order_from_its_sample():
+    # Every day is 12 or less, so only the chronology of the headers tells the order
+    data = ''.join(f"{month}/{day}/23, {hour}:{minute:02} PM - Alice: message {day} of {month}\n"
+                   for month in range(1, 13) for day in range(1, 13) for hour in range(1, 13) for minute in [0, 30])
+    source = io.StringIO(data)
+
+    batches = preprocessor.preprocess_stream(source, chunk_size=16 * 1024)
+    first = next(batches)
+
+    assert source.tell() < len(data)
+    assert first['date'].iloc[24] == pd.Timestamp('2023-01-02 13:00')
+    pd.testing.assert_frame_equal(pd.concat([first, *batches]), preprocessor.preprocess(data), check_categorical=False)
+
+
+@pytest.mark.parametrize('header', ['1/2/23, 9:75 AM - ', '[1/2/23, 9:05:60 AM] '])
+def test_out_of_range_times_are_rejected(header):
+    with pytest.raises(ValueError, match='invalid date'):
+        preprocessor.preprocess(header + 'Alice: hi\n')